@@ -0,0 +1,160 @@
+"""
+Answer cache for repeated QA questions
+On-disk (SQLite) responses keyed on normalized prompt + schema/context fingerprint + model,
+with TTL and LRU eviction and a token-overlap index for near-duplicate suggestions
+"""
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+CACHE_PATH = Path(".cache/answers.db")
+DEFAULT_TTL = 7 * 24 * 3600  # seconds
+DEFAULT_MAX_ENTRIES = 1000
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+_STOPWORDS = {"a", "an", "the", "for", "of", "on", "in", "to", "and", "or", "by", "me",
+              "please", "can", "you", "all", "with", "is", "are", "show", "give"}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return " ".join(prompt.lower().split()).rstrip(" ?.!")
+
+
+def prompt_terms(prompt: str) -> frozenset:
+    """Content words of a prompt, used for similarity lookups."""
+    return frozenset(w for w in _WORD_RE.findall(prompt.lower()) if w not in _STOPWORDS)
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    """Jaccard similarity of two term sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class AnswerCache:
+    """SQLite-backed answer cache, safe to share between sessions and threads."""
+
+    def __init__(self, path: Path = CACHE_PATH, ttl: int = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._terms = {}  # (fingerprint, model) -> {key: (prompt, terms)}
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    prompt TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )""")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS answers_scope ON answers (fingerprint, model)")
+            conn.execute("CREATE INDEX IF NOT EXISTS answers_lru ON answers (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and always closes."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(prompt: str, fingerprint: str, model: str) -> str:
+        """Cache key for a prompt in a given schema/context scope."""
+        raw = "\0".join([normalize_prompt(prompt), fingerprint, model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, fingerprint: str, model: str) -> str:
+        """Return the cached answer for an exact (normalized) match, or None."""
+        key = self.make_key(prompt, fingerprint, model)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT answer, created FROM answers WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl:
+                conn.execute(
+                    "UPDATE answers SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                self.stats["hits"] += 1
+                return row[0]
+            if row:
+                conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+                self._terms.get((fingerprint, model), {}).pop(key, None)
+                self.stats["evictions"] += 1
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, prompt: str, fingerprint: str, model: str, answer: str):
+        """Store an answer, then evict expired and least-recently-used entries."""
+        key = self.make_key(prompt, fingerprint, model)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (key, prompt, fingerprint, model, answer, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, prompt, fingerprint, model, answer, now, now))
+            self.stats["stores"] += 1
+            scope = self._terms.get((fingerprint, model))
+            if scope is not None:
+                scope[key] = (prompt, prompt_terms(prompt))
+
+            evicted = conn.execute(
+                "DELETE FROM answers WHERE created < ?", (now - self.ttl,)).rowcount
+            overflow = conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                evicted += conn.execute(
+                    "DELETE FROM answers WHERE key IN "
+                    "(SELECT key FROM answers ORDER BY last_used LIMIT ?)", (overflow,)).rowcount
+            if evicted:
+                self.stats["evictions"] += evicted
+                self._terms.clear()
+
+    def similar(self, prompt: str, fingerprint: str, model: str,
+                threshold: float = 0.5, limit: int = 3) -> list:
+        """Cached answers whose prompts overlap this one, as [(score, prompt, answer)]."""
+        scope_key = (fingerprint, model)
+        with self._lock, self._connect() as conn:
+            scope = self._terms.get(scope_key)
+            if scope is None:
+                rows = conn.execute(
+                    "SELECT key, prompt FROM answers WHERE fingerprint = ? AND model = ?",
+                    scope_key).fetchall()
+                scope = {key: (p, prompt_terms(p)) for key, p in rows}
+                self._terms[scope_key] = scope
+
+            own_key = self.make_key(prompt, fingerprint, model)
+            terms = prompt_terms(prompt)
+            scored = sorted(
+                ((jaccard(terms, t), key, p) for key, (p, t) in scope.items() if key != own_key),
+                reverse=True)
+            matches = [(score, key, p) for score, key, p in scored[:limit] if score >= threshold]
+
+            results = []
+            for score, key, p in matches:
+                row = conn.execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+                if row:
+                    results.append((score, p, row[0]))
+            return results
+
+    def clear(self):
+        """Remove every cached answer."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM answers")
+            self._terms.clear()
@@ -3,13 +3,41 @@ QA Copilot - AI-powered SQL Assistant for QA Engineers
 Interactive UI for schema-aware SQL generation with QA mentoring
 """
 
+import bisect
+import csv
+import difflib
+import hashlib
+import io
+import itertools
 import json
 import os
+import pickle
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
+from typing import TYPE_CHECKING
 
 import streamlit as st
 import yaml
-from anthropic import Anthropic
+
+from answer_cache import AnswerCache
+from chat_store import ChatStore
+from local_engine import SAMPLE_ROWS, LocalEngine
+from sql_templates import template_answer
+from sql_validator import build_column_lookup, extract_sql_blocks, repair_prompt, validate_response
+from tracing import get_tracer
+
+if TYPE_CHECKING:
+    # The SDK takes ~1-2 s to import; it is loaded on the first API call (see get_client)
+    from anthropic import Anthropic
 
 # Configuration
 TABLES_DIR = Path("tables")
@@ -17,83 +45,312 @@ SKILLS_DIR = Path(".claude/skills/qa-sql-mentor")
 SCHEMA_GEN_SKILL = Path(".claude/skills/schema-generator/SKILL.md")
 CONTEXT_DIR = Path("context")
 CHATS_DIR = Path("chats")
+SNAPSHOT_PATH = Path(".cache/schemas.pickle")
+SNAPSHOT_VERSION = 2  # bump when the parsed table info (fragments, indexes) changes shape
+TABLE_SEARCH_LIMIT = 50  # options handed to the table widgets per rerun
+
+# libyaml-backed loader/dumper when PyYAML was built with it (same output, ~5-10x faster)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CDumper", yaml.Dumper)
+
+# Timing spans; a no-op unless QA_COPILOT_TRACE is set (see tracing.py)
+tracer = get_tracer()
 
 # --- Data Loading ---
 
 
-def load_all_schemas() -> dict:
-    """Load all YAML schema files and extract table info."""
-    schemas = {}
-    if TABLES_DIR.exists():
-        for yaml_file in TABLES_DIR.glob("*.yml"):
-            with open(yaml_file, "r", encoding="utf-8") as f:
-                content = yaml.safe_load(f)
-                if not content:
+def _parse_schema_file(yaml_file: Path, data: bytes = None) -> dict:
+    """Parse one YAML schema file (or its already-read bytes) into {table_name: table_info}."""
+    tables = {}
+    if data is None:
+        data = yaml_file.read_bytes()
+    content = yaml.load(data.decode("utf-8"), Loader=YAML_LOADER)
+    if not content:
+        return tables
+
+    # Format A: Single table (new format)
+    if "table_name" in content:
+        table_name = content["table_name"]
+        tables[table_name] = {
+            "source_file": yaml_file.name,
+            "definition": content,
+            "relationships": [],
+            "business_rules": []
+        }
+
+    # Format B: Multiple tables (original format)
+    elif "tables" in content:
+        for table in content["tables"]:
+            table_name = table["name"]
+            tables[table_name] = {
+                "source_file": yaml_file.name,
+                "definition": table,
+                "relationships": content.get("relationships", []),
+                "business_rules": content.get("business_rules", [])
+            }
+
+    # Pre-render prompt fragments, column indexes and sidebar summaries once per parse
+    for table_name, info in tables.items():
+        info["fragment"] = compile_table_fragment(table_name, info)
+        info["column_index"] = build_column_index(info["definition"])
+        info["summary"] = table_summary(table_name, info["definition"])
+    return tables
+
+
+class SchemaRegistry:
+    """Process-wide schema cache: parses each file once, re-parses when its content changes.
+
+    With a `snapshot_path`, parsed files are also pickled there together with a
+    manifest of their mtime/size/sha256, so a new process skips YAML parsing for
+    every file whose content is unchanged.
+    """
+
+    def __init__(self, tables_dir: Path = TABLES_DIR, snapshot_path: Path = None):
+        self.tables_dir = tables_dir
+        self.snapshot_path = snapshot_path
+        self._files = {}  # filename -> {"mtime_ns", "size", "sha256", "tables"}
+        self._snapshot = None  # entries read from the snapshot, used by the first load only
+        self._schemas = None
+        self._texts = {}  # path -> (mtime_ns, size, text)
+        self._column_lookup = None
+        self._table_index = None
+        self._lock = threading.Lock()
+        self.stats = {"loads": 0, "files": 0, "reparsed": 0, "from_snapshot": 0,
+                      "last_load_ms": 0.0, "last_reparse_ms": 0.0}
+
+    def _read_snapshot(self) -> dict:
+        """File entries from the snapshot, or {} if it is missing, stale or unreadable."""
+        if not self.snapshot_path or not self.snapshot_path.exists():
+            return {}
+        try:
+            # Local cache written only by _write_snapshot below
+            with open(self.snapshot_path, "rb") as f:
+                data = pickle.load(f)
+        except Exception:
+            return {}
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION \
+                or data.get("tables_dir") != str(Path(self.tables_dir).resolve()):
+            return {}
+        return data.get("files", {})
+
+    def _write_snapshot(self):
+        """Atomically replace the snapshot with the current parsed files."""
+        path = self.snapshot_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump({
+                    "version": SNAPSHOT_VERSION,
+                    "tables_dir": str(Path(self.tables_dir).resolve()),
+                    "manifest": {name: entry["sha256"] for name, entry in self._files.items()},
+                    "files": self._files,
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+    @tracer.traced("schemas.load")
+    def load(self) -> dict:
+        """Return all schemas, re-parsing only files that changed since the last call."""
+        with self._lock:
+            start = time.perf_counter()
+            if self._snapshot is None:
+                self._snapshot = self._read_snapshot()
+            snapshot, self._snapshot = self._snapshot, {}
+            reparse_ms = 0.0
+            reparsed = 0
+            from_snapshot = 0
+            dirty = False
+            seen = set()
+            files = sorted(self.tables_dir.glob("*.yml")) if self.tables_dir.exists() else []
+            for yaml_file in files:
+                try:
+                    stat = yaml_file.stat()
+                    seen.add(yaml_file.name)
+                    previous = self._files.get(yaml_file.name) or snapshot.get(yaml_file.name)
+                    if previous and previous["mtime_ns"] == stat.st_mtime_ns \
+                            and previous["size"] == stat.st_size:
+                        if yaml_file.name not in self._files:
+                            self._files[yaml_file.name] = previous
+                            from_snapshot += 1
+                            self._schemas = None
+                        continue
+                    data = yaml_file.read_bytes()
+                except FileNotFoundError:
+                    seen.discard(yaml_file.name)
+                    continue
+                digest = hashlib.sha256(data).hexdigest()
+                dirty = True
+                self._schemas = None
+                if previous and previous["sha256"] == digest:
+                    # Touched or freshly checked out, content unchanged
+                    from_snapshot += yaml_file.name not in self._files
+                    self._files[yaml_file.name] = {
+                        **previous, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
                     continue
+                parse_start = time.perf_counter()
+                self._files[yaml_file.name] = {
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "sha256": digest,
+                    "tables": _parse_schema_file(yaml_file, data),
+                }
+                reparse_ms += (time.perf_counter() - parse_start) * 1000
+                reparsed += 1
+
+            for name in set(self._files) - seen:
+                del self._files[name]
+                self._schemas = None
+                dirty = True
+
+            if self.snapshot_path and (dirty or (snapshot.keys() - seen)):
+                try:
+                    self._write_snapshot()
+                except OSError:
+                    pass  # the snapshot is only a start-up shortcut
+
+            if self._schemas is None:
+                schemas = {}
+                for name in sorted(self._files):
+                    schemas.update(self._files[name]["tables"])
+                self._schemas = schemas
+                self._column_lookup = None
+                self._table_index = None
+
+            self.stats["loads"] += 1
+            self.stats["files"] = len(self._files)
+            self.stats["reparsed"] = reparsed
+            self.stats["from_snapshot"] += from_snapshot
+            self.stats["last_reparse_ms"] = reparse_ms
+            self.stats["last_load_ms"] = (time.perf_counter() - start) * 1000
+            tracer.annotate(files=len(self._files), reparsed=reparsed)
+            return self._schemas
+
+    def column_lookup(self) -> dict:
+        """Table -> column-name sets for the SQL validator, rebuilt when schemas change."""
+        schemas = self.load()
+        with self._lock:
+            if self._column_lookup is None:
+                self._column_lookup = build_column_lookup({
+                    name: [col for _, col, _ in iter_columns(info["definition"])]
+                    for name, info in schemas.items()})
+            return self._column_lookup
+
+    def table_index(self) -> "TableIndex":
+        """Search index over table names, projects, descriptions and columns."""
+        schemas = self.load()
+        with self._lock:
+            if self._table_index is None:
+                self._table_index = TableIndex(schemas)
+            return self._table_index
+
+    def read_text(self, path: Path) -> str:
+        """Read a text file, reusing the previous read while mtime/size are unchanged."""
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            cached = self._texts.get(path)
+            if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                return cached[2]
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        with self._lock:
+            self._texts[path] = (stat.st_mtime_ns, stat.st_size, text)
+        return text
+
+    def invalidate(self, filepath: Path = None):
+        """Drop one cached file (or everything) so the next load re-parses it."""
+        with self._lock:
+            if filepath is None:
+                self._files.clear()
+                self._texts.clear()
+            else:
+                self._files.pop(Path(filepath).name, None)
+            self._schemas = None
+
+
+@st.cache_resource
+def get_schema_registry() -> SchemaRegistry:
+    """Schema registry shared by all sessions and reruns, warm-started from the snapshot."""
+    return SchemaRegistry(snapshot_path=SNAPSHOT_PATH)
 
-                # Format A: Single table (new format)
-                if "table_name" in content:
-                    table_name = content["table_name"]
-                    schemas[table_name] = {
-                        "source_file": yaml_file.name,
-                        "definition": content,
-                        "relationships": [],
-                        "business_rules": []
-                    }
-
-                # Format B: Multiple tables (original format)
-                elif "tables" in content:
-                    for table in content["tables"]:
-                        table_name = table["name"]
-                        schemas[table_name] = {
-                            "source_file": yaml_file.name,
-                            "definition": table,
-                            "relationships": content.get("relationships", []),
-                            "business_rules": content.get("business_rules", [])
-                        }
-    return schemas
 
+def load_all_schemas() -> dict:
+    """Load all YAML schema files and extract table info."""
+    return get_schema_registry().load()
 
+
+@tracer.traced()
 def load_skill_prompt() -> str:
     """Load the skill prompt from SKILL.md (without frontmatter)."""
-    skill_path = SKILLS_DIR / "SKILL.md"
-    if skill_path.exists():
-        with open(skill_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            # Remove YAML frontmatter
-            if content.startswith("---"):
-                parts = content.split("---", 2)
-                if len(parts) >= 3:
-                    return parts[2].strip()
+    content = get_schema_registry().read_text(SKILLS_DIR / "SKILL.md")
+    if content:
+        # Remove YAML frontmatter
+        if content.startswith("---"):
+            parts = content.split("---", 2)
+            if len(parts) >= 3:
+                return parts[2].strip()
     return ""
 
 
+@tracer.traced()
 def load_reference() -> str:
     """Load SQL reference patterns."""
-    ref_path = SKILLS_DIR / "REFERENCE.md"
-    if ref_path.exists():
-        with open(ref_path, "r", encoding="utf-8") as f:
-            return f.read()
-    return ""
-
-
-def load_project_context(project: str) -> str:
-    """Load project context documents (WALLET_CONTEXT.md + MIGRATION.md)."""
+    return get_schema_registry().read_text(SKILLS_DIR / "REFERENCE.md") or ""
+
+
+# QA modes and the keywords that switch them on (see "Keywords → Skills" in the UI)
+QA_MODES = ("general", "migration", "regression")
+QA_MODE_KEYWORDS = {
+    "migration": ("migration", "migrate", "azure", "aws"),
+    "regression": ("regression", "baseline", "before/after", "before and after"),
+}
+
+# Context documents per project, in prompt order, with the modes that include them
+CONTEXT_DOCS = [
+    ("PROJECT.md", QA_MODES),
+    ("{PROJECT}_CONTEXT.md", QA_MODES),
+    ("MIGRATION.md", ("migration",)),
+    ("REGRESSION.md", ("regression",)),
+    ("DBT_{PROJECT}_REPO.md", ("migration", "regression")),
+]
+
+
+def detect_qa_modes(messages: list) -> tuple:
+    """QA modes mentioned anywhere in the session's user messages.
+
+    Modes are sticky for the session so the context bundle (and its prompt-cache
+    prefix) only changes when a new mode first appears.
+    """
+    text = " ".join(m["content"].lower() for m in messages if m["role"] == "user")
+    found = {mode for mode, words in QA_MODE_KEYWORDS.items()
+             if any(re.search(rf"\b{re.escape(w)}\b", text) for w in words)}
+    return tuple(mode for mode in QA_MODES if mode == "general" or mode in found)
+
+
+@tracer.traced()
+def load_project_context(project: str, modes: tuple = ("general",)) -> str:
+    """Load the project's context documents that apply to the given QA modes."""
+    registry = get_schema_registry()
     context_parts = []
+    for pattern, doc_modes in CONTEXT_DOCS:
+        if not any(mode in doc_modes for mode in modes):
+            continue
+        text = registry.read_text(CONTEXT_DIR / project / pattern.format(PROJECT=project.upper()))
+        if text:
+            context_parts.append(text)
+    return "\n\n---\n\n".join(context_parts)
 
-    # Load main domain context
-    context_path = CONTEXT_DIR / project / "WALLET_CONTEXT.md"
-    if context_path.exists():
-        with open(context_path, "r", encoding="utf-8") as f:
-            context_parts.append(f.read())
-
-    # Load migration context
-    migration_path = CONTEXT_DIR / project / "MIGRATION.md"
-    if migration_path.exists():
-        with open(migration_path, "r", encoding="utf-8") as f:
-            context_parts.append(f.read())
 
-    return "\n\n---\n\n".join(context_parts)
+def build_project_context(schemas: dict, selected_tables: list, modes: tuple = ("general",)) -> str:
+    """One context bundle for all projects of the selected tables, in stable order."""
+    projects = sorted(get_projects_from_tables(schemas, selected_tables))
+    bundles = (load_project_context(p, modes) for p in projects)
+    return "\n\n---\n\n".join(b for b in bundles if b)
 
 
 def get_projects_from_tables(schemas: dict, selected_tables: list) -> set:
@@ -109,51 +366,342 @@ def get_projects_from_tables(schemas: dict, selected_tables: list) -> set:
 
 # --- Prompt Building ---
 
+class LRUCache:
+    """Small thread-safe LRU mapping."""
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+@st.cache_resource
+def get_prompt_cache() -> LRUCache:
+    """Assembled schema text keyed by content hash, shared by all sessions."""
+    return LRUCache(maxsize=256)
+
+
+def _hash_text(*parts: str) -> str:
+    """Stable content hash of the given strings."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def compile_table_fragment(table_name: str, info: dict) -> dict:
+    """Pre-render one table's prompt text (YAML + relationships) and its business rules."""
+    parts = [
+        f"## {table_name}",
+        f"Source: `{info['source_file']}`\n",
+        yaml.dump(info["definition"], default_flow_style=False, sort_keys=False, Dumper=YAML_DUMPER),
+    ]
+
+    # Add relevant relationships
+    for rel in info["relationships"]:
+        if table_name in rel["from"] or table_name in rel["to"]:
+            parts.append(
+                f"Relationship: {rel['from']} -> {rel['to']} ({rel['type']})")
+
+    text = "\n".join(parts)
+    rules = [(rule["name"], f"Business Rule [{rule['name']}]: {rule['description']}")
+             for rule in info["business_rules"]]
+    return {"text": text, "rules": rules, "hash": _hash_text(text, *(line for _, line in rules))}
+
+
+def _temp_schema_text(temp_schema: dict) -> str:
+    """Render the temporary schema, memoized on its JSON content."""
+    definition_json = json.dumps(temp_schema["definition"], sort_keys=True, default=str)
+    key = ("temp", temp_schema["name"], _hash_text(definition_json))
+    cache = get_prompt_cache()
+    text = cache.get(key)
+    if text is None:
+        text = "\n".join([
+            f"## [Temporary] {temp_schema['name']}",
+            "Source: `session (not saved)`\n",
+            yaml.dump(temp_schema["definition"], default_flow_style=False, sort_keys=False,
+                      Dumper=YAML_DUMPER),
+        ])
+        cache.put(key, text)
+    return text
+
+
+@tracer.traced()
 def format_selected_schema(schemas: dict, selected_tables: list, temp_schema: dict = None) -> str:
     """Format only selected tables into prompt-ready text."""
     if not selected_tables and not temp_schema:
         return "No tables selected."
 
-    parts = []
-    included_rules = set()
-
+    fragments = []
     for table_name in selected_tables:
         if table_name in schemas:
             info = schemas[table_name]
-            parts.append(f"## {table_name}")
-            parts.append(f"Source: `{info['source_file']}`\n")
-            parts.append(
-                yaml.dump(info["definition"], default_flow_style=False, sort_keys=False))
+            if "fragment" not in info:
+                info["fragment"] = compile_table_fragment(table_name, info)
+            fragments.append(info["fragment"])
+
+    temp_text = _temp_schema_text(temp_schema) if temp_schema else ""
+    key = _hash_text(*(frag["hash"] for frag in fragments), temp_text)
+    cache = get_prompt_cache()
+    cached = cache.get(key)
+    tracer.annotate(tables=len(fragments), cache_hit=cached is not None)
+    if cached is not None:
+        return cached
 
-            # Add relevant relationships
-            for rel in info["relationships"]:
-                if table_name in rel["from"] or table_name in rel["to"]:
-                    parts.append(
-                        f"Relationship: {rel['from']} -> {rel['to']} ({rel['type']})")
+    parts = []
+    included_rules = set()
 
-            # Add business rules (deduplicated)
-            for rule in info["business_rules"]:
-                rule_key = rule["name"]
-                if rule_key not in included_rules:
-                    included_rules.add(rule_key)
-                    parts.append(
-                        f"Business Rule [{rule['name']}]: {rule['description']}")
+    for frag in fragments:
+        parts.append(frag["text"])
 
-            parts.append("")
+        # Add business rules (deduplicated)
+        for rule_key, line in frag["rules"]:
+            if rule_key not in included_rules:
+                included_rules.add(rule_key)
+                parts.append(line)
+
+        parts.append("")
 
     # Append temporary schema if exists
     if temp_schema:
-        parts.append(f"## [Temporary] {temp_schema['name']}")
-        parts.append("Source: `session (not saved)`\n")
-        parts.append(
-            yaml.dump(temp_schema["definition"], default_flow_style=False, sort_keys=False))
+        parts.append(temp_text)
         parts.append("")
 
-    return "\n".join(parts)
-
-
+    text = "\n".join(parts)
+    cache.put(key, text)
+    return text
+
+
+# --- Column Pruning ---
+
+SCD2_COLUMNS = {"current_record_ind", "version_no", "record_start_date_time", "record_end_date_time",
+                "effective_from", "effective_to", "valid_from", "valid_to"}
+_TERM_RE = re.compile(r"[a-z0-9]+")
+
+
+def _terms(text: str) -> set:
+    """Lowercase word terms; snake_case names split into parts."""
+    return set(_TERM_RE.findall(str(text).lower().replace("_", " ")))
+
+
+def iter_columns(definition: dict):
+    """Yield (group, name, spec) for grouped-dict or list-style columns."""
+    cols = definition.get("columns", {})
+    if isinstance(cols, dict):
+        for group, group_cols in cols.items():
+            if isinstance(group_cols, dict):
+                for name, spec in group_cols.items():
+                    yield group, name, spec if isinstance(spec, dict) else {}
+    else:
+        for col in cols or []:
+            if isinstance(col, dict) and "name" in col:
+                yield "", col["name"], col
+
+
+def build_column_index(definition: dict) -> list:
+    """Index columns with search terms and a flag for keys/grain/SCD2 columns."""
+    key_text = (json.dumps(definition.get("data_architecture", {}), default=str)
+                + " " + str(definition.get("table_grain", ""))).lower()
+    index = []
+    for group, name, spec in iter_columns(definition):
+        lname = name.lower()
+        is_key = bool(
+            spec.get("pk") or spec.get("uniqueness") or lname in SCD2_COLUMNS
+            or re.search(rf"(?<![a-z0-9_]){re.escape(lname)}(?![a-z0-9_])", key_text))
+        text_terms = _terms(group)
+        for field in ("desc", "description", "note", "type"):
+            text_terms |= _terms(spec.get(field, ""))
+        if spec.get("pii"):
+            text_terms.add("pii")
+        index.append({
+            "group": group,
+            "name": name,
+            "key": is_key,
+            "name_terms": _terms(name) | {lname},
+            "terms": text_terms,
+            "enum_terms": set().union(*(_terms(v) for v in spec.get("enum") or [])),
+        })
+    return index
+
+
+def table_summary(table_name: str, definition: dict) -> dict:
+    """Column count, project and search terms shown/used by the sidebar table pickers."""
+    columns = [name for _, name, _ in iter_columns(definition)]
+    description = str(definition.get("description", "") or "")
+    project = str(definition.get("project", "") or "")
+    return {
+        "columns": len(columns),
+        "description": description[:60],
+        "project": project,
+        "name_terms": _terms(table_name) | {table_name.lower(), table_name.split(".")[-1].lower()},
+        "terms": _terms(description) | _terms(project)
+                 | set().union(*(_terms(c) | {c.lower()} for c in columns)),
+    }
+
+
+class TableIndex:
+    """Prefix/fuzzy table search built once per schema load.
+
+    Query words match the start of terms from the table name (ranked first), its
+    project, description and column names; all words must match. Words that match
+    nothing fall back to close spellings of known terms.
+    """
+
+    def __init__(self, schemas: dict):
+        self.names = sorted(schemas)
+        self.summaries = {name: schemas[name].get("summary") or table_summary(
+            name, schemas[name]["definition"]) for name in self.names}
+        self.projects = sorted({s["project"] for s in self.summaries.values() if s["project"]})
+        postings = {}
+        for name, summary in self.summaries.items():
+            for term in summary["name_terms"]:
+                postings.setdefault(term, {})[name] = 2
+            for term in summary["terms"]:
+                postings.setdefault(term, {}).setdefault(name, 1)
+        self._terms = sorted(postings)
+        self._postings = postings
+
+    def _match(self, word: str) -> dict:
+        """{table: weight} for tables with a term starting with (or close to) `word`."""
+        matches = {}
+        start = bisect.bisect_left(self._terms, word)
+        for term in itertools.islice(self._terms, start, None):
+            if not term.startswith(word):
+                break
+            exact = 2 if term == word else 1
+            for name, weight in self._postings[term].items():
+                matches[name] = max(matches.get(name, 0), weight * 2 + exact)
+        if not matches and len(word) >= 3:
+            for term in difflib.get_close_matches(word, self._terms, n=5, cutoff=0.75):
+                for name, weight in self._postings[term].items():
+                    matches[name] = max(matches.get(name, 0), weight)
+        return matches
+
+    def search(self, query: str = "", project: str = None, limit: int = TABLE_SEARCH_LIMIT) -> tuple:
+        """(up to `limit` matching table names, total match count), best matches first."""
+        candidates = self.names
+        if project:
+            candidates = [n for n in candidates if self.summaries[n]["project"] == project]
+        words = _TERM_RE.findall(query.lower().replace("_", " ").replace(".", " "))
+        if not words:
+            return candidates[:limit], len(candidates)
+        scores = None
+        for word in words:
+            matches = self._match(word)
+            scores = matches if scores is None else {
+                n: scores[n] + w for n, w in matches.items() if n in scores}
+        allowed = set(candidates) if project else None
+        ranked = sorted((n for n in scores if allowed is None or n in allowed),
+                        key=lambda n: (-scores[n], n))
+        return ranked[:limit], len(ranked)
+
+
+def score_column(entry: dict, question_terms: set, question: str) -> float:
+    """Relevance of one column to the question."""
+    score = 3.0 * len(entry["name_terms"] & question_terms)
+    score += 2.0 * len(entry["enum_terms"] & question_terms)
+    score += 1.0 * len(entry["terms"] & question_terms)
+    if entry["name"].lower() in question:
+        score += 10.0
+    return score
+
+
+def prune_definition(definition: dict, column_index: list, question: str, top_k: int) -> tuple:
+    """Keep key/grain/SCD2 columns plus the top-K relevant ones.
+
+    Returns (pruned definition, omitted column names).
+    """
+    question = question.lower()
+    question_terms = _terms(question)
+    ranked = sorted(
+        (e for e in column_index if not e["key"]),
+        key=lambda e: score_column(e, question_terms, question), reverse=True)
+    relevant = [e for e in ranked[:top_k] if score_column(e, question_terms, question) > 0]
+    keep = {e["name"] for e in column_index if e["key"]} | {e["name"] for e in relevant}
+    omitted = [e["name"] for e in column_index if e["name"] not in keep]
+    if not omitted:
+        return definition, []
+
+    pruned = dict(definition)
+    cols = definition.get("columns", {})
+    if isinstance(cols, dict):
+        pruned["columns"] = {
+            group: {n: spec for n, spec in group_cols.items() if n in keep}
+            for group, group_cols in cols.items()
+            if isinstance(group_cols, dict) and any(n in keep for n in group_cols)}
+    else:
+        pruned["columns"] = [c for c in cols if isinstance(c, dict) and c.get("name") in keep]
+    pruned["omitted_columns"] = ", ".join(omitted)
+    return pruned, omitted
+
+
+@tracer.traced()
+def format_pruned_schema(schemas: dict, selected_tables: list, question: str, top_k: int,
+                         temp_schema: dict = None) -> tuple:
+    """Like format_selected_schema, but each table keeps only columns relevant to `question`.
+
+    Returns (schema text, {"full_tokens", "pruned_tokens", "omitted"}).
+    """
+    full_text = format_selected_schema(schemas, selected_tables, temp_schema)
+    pruned_schemas = {}
+    omitted_total = 0
+    cache = get_prompt_cache()
+    for table_name in selected_tables:
+        if table_name not in schemas:
+            continue
+        info = schemas[table_name]
+        if "column_index" not in info:
+            info["column_index"] = build_column_index(info["definition"])
+        pruned_def, omitted = prune_definition(
+            info["definition"], info["column_index"], question, top_k)
+        omitted_total += len(omitted)
+        if not omitted:
+            pruned_schemas[table_name] = info
+            continue
+        key = ("pruned", info.get("fragment", {}).get("hash", table_name), tuple(omitted))
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = compile_table_fragment(table_name, {**info, "definition": pruned_def})
+            cache.put(key, fragment)
+        pruned_schemas[table_name] = {**info, "fragment": fragment}
+
+    text = format_selected_schema(pruned_schemas, selected_tables, temp_schema)
+    return text, {"full_tokens": estimate_tokens(full_text),
+                  "pruned_tokens": estimate_tokens(text), "omitted": omitted_total}
+
+
+@tracer.traced()
 def build_system_prompt(skill_prompt: str, reference: str, schema_text: str, project_context: str = "") -> list:
-    """Build system prompt blocks with caching."""
+    """Build system prompt blocks with caching.
+
+    Blocks are ordered from most to least stable (skill/reference, project
+    context, selected tables) and each ends a cache breakpoint, so an unchanged
+    table selection is read from cache too. That uses at most 3 of the 4
+    allowed breakpoints; the 4th goes on the conversation (see _chat_request).
+    """
     blocks = [
         {
             "type": "text",
@@ -171,7 +719,8 @@ def build_system_prompt(skill_prompt: str, reference: str, schema_text: str, pro
 
     blocks.append({
         "type": "text",
-        "text": f"# Selected Tables for QA\n\n{schema_text}"
+        "text": f"# Selected Tables for QA\n\n{schema_text}",
+        "cache_control": {"type": "ephemeral"}
     })
 
     return blocks
@@ -179,32 +728,51 @@ def build_system_prompt(skill_prompt: str, reference: str, schema_text: str, pro
 
 # --- Schema Generator ---
 
+SCHEMA_MODEL = "claude-haiku-4-5-20251001"
+
+
+@tracer.traced()
 def load_schema_gen_prompt() -> str:
     """Load schema generator skill prompt."""
-    if SCHEMA_GEN_SKILL.exists():
-        with open(SCHEMA_GEN_SKILL, "r", encoding="utf-8") as f:
-            content = f.read()
-            if content.startswith("---"):
-                parts = content.split("---", 2)
-                if len(parts) >= 3:
-                    return parts[2].strip()
+    content = get_schema_registry().read_text(SCHEMA_GEN_SKILL)
+    if content:
+        if content.startswith("---"):
+            parts = content.split("---", 2)
+            if len(parts) >= 3:
+                return parts[2].strip()
     return ""
 
 
-def generate_schema(client: Anthropic, user_input: str, ref_schema: str = "") -> str:
-    """Generate table schema JSON using Claude."""
+@tracer.traced()
+def generate_schema(client: "Anthropic", user_input: str, ref_schema: str = "", stats: dict = None) -> str:
+    """Generate table schema JSON using Claude.
+
+    The skill prompt and reference schema form a cached system prefix, so
+    repeated generations against the same reference only pay for the input.
+    If `stats` is given it receives retries and a `usage` entry.
+    """
+    stats = stats if stats is not None else {}
     skill_prompt = load_schema_gen_prompt()
 
-    context = f"Generate a table schema based on this input:\n\n{user_input}"
+    system = [{"type": "text", "text": skill_prompt, "cache_control": {"type": "ephemeral"}}]
     if ref_schema:
-        context += f"\n\n---\nReference table for patterns and join keys:\n{ref_schema}"
+        system.append({
+            "type": "text",
+            "text": f"Reference table for patterns and join keys:\n{ref_schema}",
+            "cache_control": {"type": "ephemeral"}
+        })
+    context = f"Generate a table schema based on this input:\n\n{user_input}"
 
-    response = client.messages.create(
-        model="claude-haiku-4-5-20251001",
+    start = time.perf_counter()
+    response = call_with_retry(lambda: client.messages.create(
+        model=SCHEMA_MODEL,
         max_tokens=4096,
-        system=[{"type": "text", "text": skill_prompt}],
+        system=system,
         messages=[{"role": "user", "content": context}]
-    )
+    ), stats)
+    stats["usage"] = usage_entry(response.usage, (time.perf_counter() - start) * 1000,
+                                 retries=stats["retries"])
+    tracer.annotate(model=SCHEMA_MODEL, **stats["usage"])
     return response.content[0].text
 
 
@@ -221,67 +789,986 @@ def extract_json_from_response(text: str) -> str:
     return text.strip()
 
 
+def validate_schema(schema_json: str) -> tuple:
+    """Check generated schema text against the structure load_all_schemas() expects.
+
+    Returns (parsed dict or None, list of error strings).
+    """
+    try:
+        parsed = yaml.load(schema_json, Loader=YAML_LOADER)
+    except yaml.YAMLError as e:
+        return None, [f"not valid JSON/YAML: {e}"]
+    if not isinstance(parsed, dict):
+        return None, ["top level must be an object"]
+
+    errors = []
+    table_name = parsed.get("table_name")
+    if not isinstance(table_name, str) or not table_name.strip():
+        errors.append("missing table_name")
+    cols = parsed.get("columns")
+    if isinstance(cols, dict):
+        if not cols:
+            errors.append("columns is empty")
+        for group, group_cols in cols.items():
+            if not isinstance(group_cols, dict) or not group_cols:
+                errors.append(f"column group '{group}' must map column names to specs")
+            elif not all(isinstance(spec, dict) for spec in group_cols.values()):
+                errors.append(f"column group '{group}' has non-object column specs")
+    elif isinstance(cols, list):
+        if not cols or not all(isinstance(c, dict) and c.get("name") for c in cols):
+            errors.append("columns list entries need a name")
+    else:
+        errors.append("missing columns")
+    return parsed, errors
+
+
 def save_schema(table_name: str, schema_json: str) -> Path:
-    """Save schema JSON to tables directory."""
+    """Save schema JSON to tables directory (atomically)."""
     TABLES_DIR.mkdir(exist_ok=True)
     filename = table_name.split(".")[-1] + ".yml"
     filepath = TABLES_DIR / filename
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(schema_json)
+    fd, tmp_path = tempfile.mkstemp(dir=TABLES_DIR, prefix=f".{filename}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(schema_json)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    get_schema_registry().invalidate(filepath)
     return filepath
 
 
-# --- Chat History ---
+# --- Bulk Schema Generation ---
+
+BATCH_WORKERS = 4
+BATCH_REQUESTS_PER_MINUTE = 40
+BATCH_INPUT_SUFFIXES = (".txt", ".csv", ".sql", ".md")
+
 
-def list_chats() -> list:
-    """List saved chat files, sorted by modified time (newest first)."""
-    if not CHATS_DIR.exists():
+def _items_from_csv(text: str) -> list:
+    """Batch items from CSV: long (table_name, column_name[, ...]) or wide (table_name, columns)."""
+    rows = list(csv.DictReader(io.StringIO(text)))
+    if not rows:
         return []
-    files = list(CHATS_DIR.glob("*.json"))
-    files.sort(key=lambda f: f.stat().st_mtime, reverse=True)
-    return [f.stem for f in files]
+    fields = {f.strip().lower(): f for f in rows[0].keys() if f}
+    name_key = fields.get("table_name") or fields.get("table")
+    if not name_key:
+        raise ValueError("CSV needs a table_name column")
+
+    if "column_name" in fields:
+        # Long format: one row per column; other fields become column hints
+        col_key = fields["column_name"]
+        tables = {}
+        for row in rows:
+            hints = ", ".join(f"{k}={v}" for k, v in row.items()
+                              if k not in (name_key, col_key) and v)
+            line = row[col_key].strip() + (f" ({hints})" if hints else "")
+            tables.setdefault(row[name_key].strip(), []).append(line)
+        return [{"name": name, "input": "\n".join(cols)} for name, cols in tables.items()]
+
+    input_key = fields.get("columns") or fields.get("input") or fields.get("context")
+    if not input_key:
+        raise ValueError("CSV needs a columns (or column_name) column")
+    return [{"name": row[name_key].strip(), "input": row[input_key]}
+            for row in rows if row[name_key].strip()]
+
+
+def read_schema_inputs(path: Path) -> list:
+    """Batch items [{name, input}] from a CSV file or a directory of column-list files."""
+    path = Path(path)
+    if path.is_dir():
+        items = []
+        for f in sorted(path.iterdir()):
+            if f.suffix.lower() == ".csv":
+                items += _items_from_csv(f.read_text(encoding="utf-8"))
+            elif f.suffix.lower() in BATCH_INPUT_SUFFIXES:
+                items.append({"name": f.stem, "input": f.read_text(encoding="utf-8")})
+        return items
+    return _items_from_csv(path.read_text(encoding="utf-8"))
+
+
+class RateLimiter:
+    """Spaces calls so no more than `per_minute` start in any minute (thread-safe)."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._next - now)
+            self._next = max(now, self._next) + self.interval
+        if wait:
+            time.sleep(wait)
+
+
+def _generate_one(client, item: dict, ref_schema: str, limiter: RateLimiter,
+                  save: bool, overwrite: bool) -> dict:
+    """Generate, validate and (optionally) save one batch item."""
+    result = {"name": item["name"], "status": "error", "errors": [], "path": None, "usage": None}
+    limiter.acquire()
+    stats = {}
+    try:
+        response = generate_schema(
+            client, f"Table name: {item['name']}\n\n{item['input']}", ref_schema, stats)
+    except Exception as e:
+        result["errors"] = [describe_api_error(e)]
+        return result
+    result["usage"] = stats.get("usage")
+
+    schema_json = extract_json_from_response(response)
+    parsed, errors = validate_schema(schema_json)
+    if errors:
+        result.update(status="invalid", errors=errors)
+        return result
+    result["table_name"] = parsed["table_name"]
+
+    if save:
+        target = TABLES_DIR / (parsed["table_name"].split(".")[-1] + ".yml")
+        if target.exists() and not overwrite:
+            result.update(status="exists", path=target)
+            return result
+        result["path"] = save_schema(parsed["table_name"], schema_json)
+    result["status"] = "ok"
+    return result
+
+
+def run_schema_batch(client, items: list, ref_schema: str = "", workers: int = BATCH_WORKERS,
+                     per_minute: float = BATCH_REQUESTS_PER_MINUTE, save: bool = True,
+                     overwrite: bool = False, on_result=None) -> dict:
+    """Generate schemas for many tables concurrently and return a throughput report.
+
+    `on_result(result, done, total)` is called from the calling thread as each
+    table finishes.
+    """
+    limiter = RateLimiter(per_minute)
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_generate_one, client, item, ref_schema, limiter, save, overwrite)
+                   for item in items]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if on_result:
+                on_result(results[-1], len(results), len(items))
+
+    elapsed = time.perf_counter() - start
+    usage = usage_summary([r["usage"] for r in results if r["usage"]])
+    counts = {status: sum(1 for r in results if r["status"] == status)
+              for status in ("ok", "invalid", "exists", "error")}
+    return {
+        "results": sorted(results, key=lambda r: r["name"]),
+        "total": len(items),
+        **counts,
+        "elapsed_s": elapsed,
+        "tables_per_min": len(items) / elapsed * 60 if elapsed else 0.0,
+        "input_tokens": usage["input_tokens"],
+        "cache_read_input_tokens": usage["cache_read_input_tokens"],
+        "output_tokens": usage["output_tokens"],
+        "cost_usd": usage["cost_usd"],
+    }
+
+
+# --- Chat History ---
+
+CHATS_PAGE_SIZE = 10
+HISTORY_PAGE_SIZE = 20  # latest messages rendered; older ones load on demand
+
 
+@st.cache_resource
+def get_chat_store() -> ChatStore:
+    """Chat store shared by all sessions; imports legacy chats/*.json on first start."""
+    store = ChatStore(CHATS_DIR / "chats.db")
+    store.migrate_json(CHATS_DIR)
+    return store
 
+
+@tracer.traced("chats.list")
+def list_chats(limit: int = CHATS_PAGE_SIZE, offset: int = 0) -> list:
+    """List saved chat names, sorted by modified time (newest first)."""
+    return [row["name"] for row in get_chat_store().list(limit, offset)]
+
+
+@tracer.traced("chats.save")
 def save_chat(name: str, messages: list, tables: list, temp_schema: dict = None):
-    """Save chat to file."""
-    CHATS_DIR.mkdir(exist_ok=True)
-    data = {"messages": messages, "tables": tables, "temp_schema": temp_schema}
-    with open(CHATS_DIR / f"{name}.json", "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    """Save chat, appending messages added since the last save."""
+    get_chat_store().save(name, messages, tables, temp_schema)
 
 
+@tracer.traced("chats.load")
 def load_chat(name: str) -> dict:
-    """Load chat from file."""
-    with open(CHATS_DIR / f"{name}.json", "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Load chat from the store."""
+    return get_chat_store().load(name)
 
 
+@tracer.traced("chats.delete")
 def delete_chat(name: str):
     """Delete a saved chat."""
-    filepath = CHATS_DIR / f"{name}.json"
-    if filepath.exists():
-        filepath.unlink()
+    get_chat_store().delete(name)
 
 
-# --- Claude API ---
+@tracer.traced("chats.search")
+def search_chats(query: str) -> list:
+    """Saved chats matching `query`, best first: [{name, snippet}]."""
+    return get_chat_store().search(query)
 
-MAX_HISTORY = 20  # messages
 
+# --- History Window ---
 
-def chat_with_claude(client: Anthropic, system_blocks: list, messages: list) -> str:
-    """Send chat to Claude and return response."""
-    trimmed = messages[-MAX_HISTORY:] if len(
-        messages) > MAX_HISTORY else messages
+HISTORY_TOKEN_BUDGET = 60000  # input tokens for system blocks + history
+SUMMARY_MAX_TURNS = 30  # earlier questions kept in the rolling summary
 
-    response = client.messages.create(
-        model="claude-haiku-4-5-20251001",  # "claude-sonnet-4-20250514",
-        max_tokens=4096,
-        system=system_blocks,
-        messages=trimmed
-    )
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def message_tokens(msg: dict) -> int:
+    """Token estimate for a message, cached on the message itself."""
+    content = msg["content"]
+    cached = msg.get("_tokens")
+    if cached and cached[0] == len(content):
+        return cached[1]
+    tokens = estimate_tokens(content) + 4  # role/framing overhead
+    msg["_tokens"] = [len(content), tokens]
+    return tokens
+
+
+def system_tokens(system_blocks: list) -> int:
+    """Token estimate for the system prompt blocks."""
+    return sum(estimate_tokens(block["text"]) for block in system_blocks)
+
+
+def summarize_turns(messages: list) -> str:
+    """Collapse older turns into a short list of earlier questions (cached)."""
+    key = ("summary", _hash_text(*(m["content"] for m in messages)))
+    cache = get_prompt_cache()
+    summary = cache.get(key)
+    if summary is None:
+        questions = [m["content"].strip().splitlines()[0][:200]
+                     for m in messages if m["role"] == "user" and m["content"].strip()]
+        answers = sum(1 for m in messages if m["role"] == "assistant")
+        lines = [f"- {q}" for q in questions[-SUMMARY_MAX_TURNS:]]
+        if len(questions) > SUMMARY_MAX_TURNS:
+            lines.insert(0, f"- ...{len(questions) - SUMMARY_MAX_TURNS} earlier questions omitted")
+        summary = (f"Summary of {len(questions)} earlier questions "
+                   f"({answers} answers not shown):\n" + "\n".join(lines))
+        cache.put(key, summary)
+    return summary
+
+
+def window_history(messages: list, budget: int = HISTORY_TOKEN_BUDGET, reserved: int = 0) -> list:
+    """Keep the newest turns that fit the token budget, as API-ready messages.
+
+    `reserved` tokens (system blocks) are subtracted from the budget. The result
+    starts with a user turn and strictly alternates roles; dropped turns are
+    folded into a summary prefixed to the first kept user message.
+    """
+    if not messages:
+        return []
+
+    # Merge consecutive same-role messages so roles alternate
+    turns = []
+    for msg in messages:
+        if turns and turns[-1]["role"] == msg["role"]:
+            turns[-1]["content"] += "\n\n" + msg["content"]
+            turns[-1]["tokens"] += message_tokens(msg)
+        else:
+            turns.append({"role": msg["role"], "content": msg["content"],
+                          "tokens": message_tokens(msg)})
+
+    available = budget - reserved
+    used = 0
+    start = len(turns)
+    while start > 0:
+        tokens = turns[start - 1]["tokens"]
+        if used + tokens > available and start < len(turns):
+            break
+        used += tokens
+        start -= 1
+
+    # Never open on an assistant turn
+    while start < len(turns) - 1 and turns[start]["role"] != "user":
+        start += 1
+
+    kept = [{"role": t["role"], "content": t["content"]} for t in turns[start:]]
+    dropped = turns[:start]
+    if any(t["role"] == "user" for t in dropped):
+        summary = summarize_turns(dropped)
+        kept[0]["content"] = f"{summary}\n\n---\n\n{kept[0]['content']}"
+    return kept
+
+
+# --- Claude API ---
+
+CHAT_MODEL = "claude-haiku-4-5-20251001"  # "claude-sonnet-4-20250514"
+
+
+# HTTP connection pool and timeouts shared by every request through a client
+POOL_MAX_CONNECTIONS = 20
+POOL_MAX_KEEPALIVE = 10
+POOL_KEEPALIVE_EXPIRY = 60.0  # seconds
+CONNECT_TIMEOUT = 5.0  # seconds
+READ_TIMEOUT = 120.0  # seconds
+
+# Retry policy (the SDK's own retries are disabled in favour of call_with_retry)
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 0.5  # seconds
+RETRY_MAX_DELAY = 30.0  # seconds
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+@st.cache_resource
+def get_client(api_key: str, base_url: str = None):
+    """Shared API client per key (offline stub when QA_COPILOT_STUB is set).
+
+    Cached across reruns and sessions so HTTP keep-alive connections and TLS
+    sessions are reused.
+    """
+    if os.getenv("QA_COPILOT_STUB"):
+        from stub_client import StubAnthropic
+        return StubAnthropic(chunk_delay=0.02)
+    import anthropic
+
+    # Limits class of whichever httpx flavour the installed SDK ships with
+    limits_cls = type(anthropic.DEFAULT_CONNECTION_LIMITS)
+    timeout = anthropic.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    http_client = anthropic.DefaultHttpxClient(
+        limits=limits_cls(max_connections=POOL_MAX_CONNECTIONS,
+                          max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                          keepalive_expiry=POOL_KEEPALIVE_EXPIRY),
+        timeout=timeout)
+    return anthropic.Anthropic(api_key=api_key, base_url=base_url, timeout=timeout,
+                               max_retries=0, http_client=http_client)
+
+
+def _sdk_errors():
+    """The anthropic module if a client has imported it, else None (no SDK error can exist)."""
+    return sys.modules.get("anthropic")
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Transient errors worth retrying: connection problems, timeouts, 429/5xx/529."""
+    anthropic = _sdk_errors()
+    if anthropic is None:
+        return False
+    if isinstance(error, (anthropic.APIConnectionError, anthropic.APITimeoutError)):
+        return True
+    return isinstance(error, anthropic.APIStatusError) and error.status_code in RETRY_STATUS
+
+
+def _retry_after(error: Exception) -> float:
+    """Server-requested delay in seconds from retry-after headers, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def call_with_retry(fn, stats: dict = None, max_retries: int = MAX_RETRIES,
+                    base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY):
+    """Call `fn()` with jittered exponential backoff on transient API errors.
+
+    A retry-after header from the server takes precedence over the computed delay.
+    If `stats` is given it receives retries and retry_wait_s.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("retries", 0)
+    stats.setdefault("retry_wait_s", 0.0)
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after(e)
+            if delay is None:
+                delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            delay = min(delay, max_delay)
+            attempt += 1
+            stats["retries"] += 1
+            stats["retry_wait_s"] += delay
+            time.sleep(delay)
+
+
+def describe_api_error(error: Exception) -> str:
+    """User-facing message for an API failure."""
+    anthropic = _sdk_errors()
+    if anthropic is None:
+        return f"Error: {error}"
+    if isinstance(error, anthropic.RateLimitError):
+        return "Rate limited by the Claude API (429) after retrying. Please wait a moment and try again."
+    if isinstance(error, anthropic.APIStatusError) and error.status_code == 529:
+        return "The Claude API is overloaded (529) after retrying. Please try again shortly."
+    if isinstance(error, anthropic.AuthenticationError):
+        return "The API key was rejected. Check the key in the sidebar."
+    if isinstance(error, anthropic.APITimeoutError):
+        return f"The request timed out after {READ_TIMEOUT:.0f}s."
+    if isinstance(error, anthropic.APIConnectionError):
+        return "Could not connect to the Claude API."
+    return f"Error: {error}"
+
+
+def _chat_request(system_blocks: list, messages: list, history_budget: int = HISTORY_TOKEN_BUDGET) -> dict:
+    """Build messages.create/stream arguments for a chat turn."""
+    window = window_history(messages, history_budget, system_tokens(system_blocks))
+    if window:
+        # Cache breakpoint on the latest turn so the next turn reads the history prefix
+        last = window[-1]
+        last["content"] = [{"type": "text", "text": last["content"],
+                            "cache_control": {"type": "ephemeral"}}]
+    return {
+        "model": CHAT_MODEL,
+        "max_tokens": 4096,
+        "system": system_blocks,
+        "messages": window,
+    }
+
+
+# USD per million tokens for CHAT_MODEL
+PRICE_PER_MTOK = {"input": 1.00, "output": 5.00, "cache_write": 1.25, "cache_read": 0.10}
+
+
+def usage_entry(usage, latency_ms: float, ttft_ms: float = None, retries: int = 0) -> dict:
+    """Flatten an API usage object into a log entry with an estimated cost."""
+    entry = {
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+        "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+        "latency_ms": latency_ms,
+        "ttft_ms": ttft_ms,
+        "retries": retries,
+    }
+    entry["cost_usd"] = (
+        entry["input_tokens"] * PRICE_PER_MTOK["input"]
+        + entry["cache_creation_input_tokens"] * PRICE_PER_MTOK["cache_write"]
+        + entry["cache_read_input_tokens"] * PRICE_PER_MTOK["cache_read"]
+        + entry["output_tokens"] * PRICE_PER_MTOK["output"]) / 1_000_000
+    return entry
+
+
+def usage_summary(log: list) -> dict:
+    """Aggregate usage entries into hit rate, token totals, cost and latency."""
+    totals = {k: sum(e[k] for e in log) for k in (
+        "input_tokens", "cache_creation_input_tokens", "cache_read_input_tokens",
+        "output_tokens", "cost_usd")}
+    totals["retries"] = sum(e.get("retries", 0) for e in log)
+    prompt_tokens = (totals["input_tokens"] + totals["cache_creation_input_tokens"]
+                     + totals["cache_read_input_tokens"])
+    uncached_cost = (prompt_tokens * PRICE_PER_MTOK["input"]
+                     + totals["output_tokens"] * PRICE_PER_MTOK["output"]) / 1_000_000
+    ttfts = [e["ttft_ms"] for e in log if e.get("ttft_ms") is not None]
+    totals.update({
+        "requests": len(log),
+        "hit_rate": totals["cache_read_input_tokens"] / prompt_tokens if prompt_tokens else 0.0,
+        "saved_usd": uncached_cost - totals["cost_usd"],
+        "avg_latency_ms": sum(e["latency_ms"] for e in log) / len(log) if log else 0.0,
+        "avg_ttft_ms": sum(ttfts) / len(ttfts) if ttfts else None,
+    })
+    return totals
+
+
+@tracer.traced()
+def chat_with_claude(client: "Anthropic", system_blocks: list, messages: list,
+                     history_budget: int = HISTORY_TOKEN_BUDGET, stats: dict = None) -> str:
+    """Send chat to Claude and return response.
+
+    If `stats` is given it receives total_ms, retries and a `usage` entry (see usage_entry).
+    """
+    stats = stats if stats is not None else {}
+    start = time.perf_counter()
+    request = _chat_request(system_blocks, messages, history_budget)
+    response = call_with_retry(lambda: client.messages.create(**request), stats)
+    stats["total_ms"] = (time.perf_counter() - start) * 1000
+    stats["usage"] = usage_entry(response.usage, stats["total_ms"], retries=stats["retries"])
+    tracer.annotate(model=CHAT_MODEL, **stats["usage"])
     return response.content[0].text
 
 
+def chat_with_claude_stream(client: "Anthropic", system_blocks: list, messages: list, stats: dict = None,
+                            history_budget: int = HISTORY_TOKEN_BUDGET):
+    """Stream a chat response, yielding text deltas as they arrive.
+
+    If `stats` is given it receives ttft_ms (time to first token), total_ms,
+    retries and a `usage` entry (see usage_entry). Only opening the stream is
+    retried; a failure mid-answer is raised.
+    """
+    stats = stats if stats is not None else {}
+    # A span in the generator body covers the whole stream, not just its creation
+    with tracer.span("chat_with_claude_stream", model=CHAT_MODEL) as span:
+        start = time.perf_counter()
+        request = _chat_request(system_blocks, messages, history_budget)
+        manager = client.messages.stream(**request)
+        stream = call_with_retry(manager.__enter__, stats)
+        try:
+            for text in stream.text_stream:
+                if "ttft_ms" not in stats:
+                    stats["ttft_ms"] = (time.perf_counter() - start) * 1000
+                yield text
+            final = stream.get_final_message()
+        finally:
+            manager.__exit__(None, None, None)
+        stats["total_ms"] = (time.perf_counter() - start) * 1000
+        stats["usage"] = usage_entry(final.usage, stats["total_ms"], stats.get("ttft_ms"),
+                                     stats["retries"])
+        span.set(**stats["usage"])
+
+
+# --- Answer Cache ---
+
+@st.cache_resource
+def get_answer_cache() -> AnswerCache:
+    """On-disk answer cache shared by all sessions."""
+    return AnswerCache()
+
+
+def context_fingerprint(schema_text: str, project_context: str) -> str:
+    """Fingerprint of everything besides the question that shapes an answer."""
+    return _hash_text(schema_text, project_context)
+
+
+# --- Prompt Cache Warm-up ---
+
+WARMUP_DEBOUNCE_S = 2.0  # wait for the selection to settle before sending
+WARMUP_TTL_S = 270.0  # re-warm a prefix after this long (the ephemeral cache lives 5 minutes)
+
+
+def prefix_hash(system_blocks: list) -> str:
+    """Hash of the exact system prompt blocks that form the cached prefix."""
+    return _hash_text(*(block["text"] for block in system_blocks))
+
+
+class PromptWarmer:
+    """Writes system prompts into the prompt cache in the background before the first question.
+
+    Requests are debounced per session and deduplicated across sessions by prefix
+    hash. Also records first-question time-to-first-token with and without warm-up.
+    """
+
+    def __init__(self, debounce_s: float = WARMUP_DEBOUNCE_S, ttl_s: float = WARMUP_TTL_S):
+        self.debounce_s = debounce_s
+        self.ttl_s = ttl_s
+        self._timers = {}  # session key -> pending threading.Timer
+        self._warmed = {}  # prefix hash -> time.time() of the last successful warm-up
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self.usage = []
+        self.first_ttft = {"warm": [], "cold": []}
+        self.stats = {"scheduled": 0, "sent": 0, "deduped": 0, "errors": 0}
+
+    def is_warm(self, key: str) -> bool:
+        with self._lock:
+            return time.time() - self._warmed.get(key, float("-inf")) < self.ttl_s
+
+    def mark_warm(self, key: str):
+        """Record that a real request just wrote this prefix, so it is not warmed again."""
+        with self._lock:
+            self._warmed[key] = time.time()
+
+    def schedule(self, session_key: str, client, system_blocks: list) -> str:
+        """(Re)start the debounce timer for a session; returns the prefix hash."""
+        key = prefix_hash(system_blocks)
+        timer = threading.Timer(self.debounce_s, self._warm, (session_key, client, system_blocks, key))
+        timer.daemon = True
+        with self._lock:
+            previous = self._timers.pop(session_key, None)
+            self._timers[session_key] = timer
+            self.stats["scheduled"] += 1
+        if previous:
+            previous.cancel()
+        timer.start()
+        return key
+
+    def _warm(self, session_key: str, client, system_blocks: list, key: str):
+        with self._lock:
+            if self._timers.get(session_key) is threading.current_thread():
+                del self._timers[session_key]
+            if key in self._inflight or time.time() - self._warmed.get(key, float("-inf")) < self.ttl_s:
+                self.stats["deduped"] += 1
+                return
+            self._inflight.add(key)
+        start = time.perf_counter()
+        try:
+            with tracer.span("prompt_warmup", prefix=key[:12]):
+                # One output token: the request exists only to write the cached prefix
+                response = call_with_retry(lambda: client.messages.create(
+                    model=CHAT_MODEL, max_tokens=1, system=system_blocks,
+                    messages=[{"role": "user", "content": "Ready?"}]))
+            with self._lock:
+                self._warmed[key] = time.time()
+                self.usage.append(usage_entry(response.usage, (time.perf_counter() - start) * 1000))
+                self.stats["sent"] += 1
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1  # warm-up is best effort; the question still works
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def record_first_question(self, warmed: bool, ttft_ms: float):
+        """Time to first token of the first question asked on a prefix."""
+        with self._lock:
+            self.first_ttft["warm" if warmed else "cold"].append(ttft_ms)
+
+
+@st.cache_resource
+def get_prompt_warmer() -> PromptWarmer:
+    """Prompt-cache warmer shared by all sessions (dedupes identical prefixes)."""
+    return PromptWarmer()
+
+
+# --- Quick Checklist ---
+
+CHECKLIST_KEYWORDS = ("standard qa", "full checklist", "health check", "quick checklist")
+CHECKLIST_WORKERS = 4
+CHECKLIST_PRIME_TIMEOUT = 30.0  # seconds to wait for the first section to populate the prompt cache
+
+# (key, title, focus instruction); "scd2" only applies when a selected table is SCD2
+CHECKLIST_SECTIONS = [
+    ("row_counts", "Row counts & freshness",
+     "total row counts, counts per load date/period, and the latest load timestamp"),
+    ("duplicates", "Duplicates & grain",
+     "duplicate detection on the primary key and on the table grain / natural key"),
+    ("nulls", "NULL checks",
+     "NULL counts and NULL percentages for key and business-critical columns"),
+    ("scd2", "SCD2 integrity",
+     "exactly one current record per natural key, version sequence gaps, and overlapping "
+     "effective date ranges"),
+    ("balances", "Balance & reconciliation",
+     "sums, negative values and opening/closing reconciliation for balance and amount columns "
+     "(say so briefly if the tables have none)"),
+]
+
+
+def is_checklist_request(prompt: str) -> bool:
+    """True if the prompt asks for the full Quick Checklist."""
+    prompt = prompt.lower()
+    return any(keyword in prompt for keyword in CHECKLIST_KEYWORDS)
+
+
+def is_scd2_table(definition: dict) -> bool:
+    """True if the definition looks like an SCD2 table."""
+    names = {name.lower() for _, name, _ in iter_columns(definition)}
+    arch = json.dumps(definition.get("data_architecture", {}), default=str).lower()
+    return "current_record_ind" in names or "scd" in arch
+
+
+def checklist_sections(schemas: dict, selected_tables: list, temp_schema: dict = None) -> list:
+    """Checklist sections that apply to the selected tables."""
+    definitions = [schemas[t]["definition"] for t in selected_tables if t in schemas]
+    if temp_schema:
+        definitions.append(temp_schema["definition"])
+    has_scd2 = any(is_scd2_table(d) for d in definitions)
+    return [s for s in CHECKLIST_SECTIONS if s[0] != "scd2" or has_scd2]
+
+
+def _section_messages(messages: list, section: tuple) -> list:
+    """Conversation with the last user turn narrowed to one checklist section."""
+    _, title, focus = section
+    last = messages[-1]
+    narrowed = (f"{last['content']}\n\n"
+                f"Generate ONLY the \"{title}\" part of the checklist: {focus}. "
+                f"Put all SQL for this part in a single ```sql block, followed by brief QA notes.")
+    return messages[:-1] + [{"role": "user", "content": narrowed}]
+
+
+def _run_section(client, system_blocks: list, messages: list, history_budget: int,
+                 stats: dict, first_token: threading.Event = None) -> str:
+    """Generate one section; streams so `first_token` can be set as soon as output starts."""
+    try:
+        parts = []
+        for text in chat_with_claude_stream(client, system_blocks, messages, stats, history_budget):
+            if first_token is not None:
+                first_token.set()
+            parts.append(text)
+        return "".join(parts)
+    finally:
+        if first_token is not None:
+            first_token.set()
+
+
+def run_checklist(client, system_blocks: list, messages: list, sections: list,
+                  history_budget: int = HISTORY_TOKEN_BUDGET, max_workers: int = CHECKLIST_WORKERS):
+    """Generate checklist sections concurrently, yielding (index, text, stats) as each finishes.
+
+    The first section starts alone; the rest are submitted once it produces its
+    first token, so they read the shared system prefix from the prompt cache
+    instead of all writing it. A failed section yields its error text.
+    """
+    first_token = threading.Event()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {}
+        for i, section in enumerate(sections):
+            stats = {}
+            futures[pool.submit(
+                _run_section, client, system_blocks, _section_messages(messages, section),
+                history_budget, stats, first_token if i == 0 else None)] = (i, stats)
+            if i == 0:
+                first_token.wait(CHECKLIST_PRIME_TIMEOUT)
+        for future in as_completed(futures):
+            i, stats = futures[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                text = f"⚠️ {describe_api_error(e)}"
+            yield i, text, stats
+
+
+def merge_checklist(sections: list, texts: list) -> str:
+    """One response: each section's answer in order, then a combined SQL script."""
+    parts = ["## Quick Checklist", ""]
+    script = []
+    for n, (section, text) in enumerate(zip(sections, texts), 1):
+        parts += [f"### {n}. {section[1]}", "", text, ""]
+        for block in extract_sql_blocks(text):
+            script += [f"-- ===== {n}. {section[1]} =====", block, ""]
+    if script:
+        parts += ["### Combined SQL script", "", "```sql", "\n".join(script).rstrip(), "```"]
+    return "\n".join(parts)
+
+
+# --- Template Answers ---
+
+def template_tables(schemas: dict, selected_tables: list, temp_schema: dict = None) -> list:
+    """Selected (and temp) tables in the shape sql_templates expects."""
+    infos = [(name, schemas[name]) for name in selected_tables if name in schemas]
+    if temp_schema:
+        infos.append((temp_schema["name"], {"definition": temp_schema["definition"]}))
+    tables = []
+    for name, info in infos:
+        if "template_table" not in info:
+            definition = info["definition"]
+            columns = list({col.lower(): (col, spec)
+                            for _, col, spec in iter_columns(definition)}.values())
+            info["template_table"] = {"name": name, "definition": definition, "columns": columns,
+                                      "scd2": is_scd2_table(definition)}
+        tables.append(info["template_table"])
+    return tables
+
+
+@tracer.traced()
+def answer_from_templates(prompt: str, schemas: dict, selected_tables: list,
+                          temp_schema: dict = None, stats: dict = None) -> str:
+    """Template answer for a standard check, or None when the model is needed.
+
+    `stats` ({"requests", "hits", "hit_ms"}) is updated in place. Checklist requests
+    always go to the model so every checklist section is answered.
+    """
+    result = None if is_checklist_request(prompt) else template_answer(
+        prompt, template_tables(schemas, selected_tables, temp_schema))
+    if stats is not None:
+        stats["requests"] += 1
+        if result:
+            stats["hits"] += 1
+            stats["hit_ms"] += result["elapsed_ms"]
+    tracer.annotate(hit=bool(result))
+    return result["response"] if result else None
+
+
+# --- Local Dry Run ---
+
+@st.cache_resource
+def get_local_engine() -> LocalEngine:
+    """SQLite dry-run engine shared by all sessions (tables built on first use)."""
+    return LocalEngine()
+
+
+def local_table_spec(name: str, info: dict) -> dict:
+    """Columns and key/SCD2 roles the local engine needs to synthesize rows for a table."""
+    definition = info["definition"]
+    columns, seen = [], set()
+    for _, col, spec in iter_columns(definition):
+        if col.lower() not in seen:
+            seen.add(col.lower())
+            columns.append((col, spec))
+    arch = definition.get("data_architecture") or {}
+
+    def named_in(text) -> list:
+        words = set(re.findall(r"[a-z0-9_]+", str(text or "").lower()))
+        return [col for col, _ in columns if col.lower() in words]
+
+    pk = named_in(arch.get("primary_key")) + [col for col, spec in columns if spec.get("pk")]
+    grain = named_in(definition.get("table_grain"))
+    unique = pk + grain + [col for col, spec in columns
+                           if str(spec.get("uniqueness", "")).upper().startswith("UNIQUE")]
+    scd2 = is_scd2_table(definition)
+    member = []
+    if scd2:
+        # Business and grain keys repeat across versions; only the surrogate key is unique per row
+        member = [c for c in named_in(arch.get("natural_key")) + grain or unique if c not in pk]
+        unique = [c for c in unique if c not in member]
+    unique, member = list(dict.fromkeys(unique)), list(dict.fromkeys(member))
+    return {"name": name, "columns": columns, "unique": unique, "member": member, "scd2": scd2,
+            "hash": info.get("fragment", {}).get("hash") or _hash_text(
+                json.dumps(definition, sort_keys=True, default=str))}
+
+
+def local_table_specs(schemas: dict, blocks: list, temp_schema: dict = None) -> dict:
+    """Engine specs for the loaded (and temp) tables the SQL blocks reference."""
+    candidates = dict(schemas)
+    if temp_schema:
+        candidates[temp_schema["name"]] = {"definition": temp_schema["definition"]}
+    specs = {}
+    for block in blocks:
+        for name in LocalEngine.referenced_tables(block, candidates):
+            if name not in specs:
+                info = candidates[name]
+                if "local_spec" not in info:
+                    info["local_spec"] = local_table_spec(name, info)
+                specs[name] = info["local_spec"]
+    return specs
+
+
+@tracer.traced()
+def dry_run_sql(response: str, schemas: dict, temp_schema: dict = None) -> list:
+    """Run every SQL block of a response on the local engine: [(block, result)]."""
+    blocks = extract_sql_blocks(response)
+    if not blocks:
+        return []
+    results = get_local_engine().run_checks(blocks, local_table_specs(schemas, blocks, temp_schema))
+    tracer.annotate(blocks=len(blocks), cached=sum(r["cached"] for r in results))
+    return list(zip(blocks, results))
+
+
+# --- Batch QA ---
+
+def read_prompt_file(path: Path) -> list:
+    """QA prompts from a JSONL file: one {"prompt", "tables", "id"?} object per line.
+
+    Items without an id get a stable one from their prompt and tables, so a
+    rerun of the same file can resume from a checkpoint.
+    """
+    items = []
+    for lineno, line in enumerate(Path(path).read_text(encoding="utf-8").splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {lineno}: {e}") from None
+        if not isinstance(item, dict) or not str(item.get("prompt", "")).strip():
+            raise ValueError(f"line {lineno}: expected an object with a non-empty \"prompt\"")
+        tables = item.get("tables") or []
+        if isinstance(tables, str):
+            tables = [tables]
+        items.append({
+            "id": str(item.get("id") or _hash_text(item["prompt"], *tables)[:12]),
+            "prompt": item["prompt"],
+            "tables": list(tables),
+        })
+    return items
+
+
+def _answer_one(client, item: dict, schemas: dict, limiter: RateLimiter,
+                history_budget: int, dry_run: bool = False, use_templates: bool = True) -> dict:
+    """Run one batch prompt through the template engine or the chat pipeline."""
+    result = {"id": item["id"], "prompt": item["prompt"], "tables": item["tables"],
+              "status": "error", "response": None, "error": None, "unknown_columns": [],
+              "usage": None, "source": "model"}
+    unknown = [t for t in item["tables"] if t not in schemas]
+    if unknown:
+        result["error"] = f"Unknown tables: {', '.join(unknown)}"
+        return result
+
+    response = answer_from_templates(item["prompt"], schemas, item["tables"]) \
+        if use_templates else None
+    if response:
+        result.update(status="ok", response=response, source="template")
+    else:
+        messages = [{"role": "user", "content": item["prompt"]}]
+        schema_text = format_selected_schema(schemas, item["tables"])
+        project_context = build_project_context(schemas, item["tables"], detect_qa_modes(messages))
+        system_blocks = build_system_prompt(
+            load_skill_prompt(), load_reference(), schema_text, project_context)
+
+        limiter.acquire()
+        stats = {}
+        try:
+            response = chat_with_claude(client, system_blocks, messages, history_budget, stats)
+        except Exception as e:
+            result["error"] = describe_api_error(e)
+            return result
+        report = validate_response(response, get_schema_registry().column_lookup())
+        result.update(status="ok", response=response, usage=stats["usage"],
+                      unknown_columns=[issue["identifier"] for issue in report["issues"]])
+    if dry_run:
+        result["dry_run"] = [
+            {"status": r["status"], "row_count": r["row_count"], "error": r["error"]}
+            for _, r in dry_run_sql(response, schemas)]
+    return result
+
+
+def run_qa_batch(client, items: list, workers: int = BATCH_WORKERS,
+                 per_minute: float = BATCH_REQUESTS_PER_MINUTE,
+                 history_budget: int = HISTORY_TOKEN_BUDGET, on_result=None,
+                 dry_run: bool = False, use_templates: bool = True) -> dict:
+    """Answer many QA prompts concurrently and return a throughput report.
+
+    Prompts with the same table set share a system prompt: the first one of each
+    set runs alone to write the prompt cache, the rest are released when it
+    finishes and read it. `on_result(result, done, total)` is called from the
+    calling thread as each prompt finishes.
+    """
+    schemas = load_all_schemas()
+    groups = {}
+    for item in items:
+        groups.setdefault(tuple(item["tables"]), []).append(item)
+
+    limiter = RateLimiter(per_minute)
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        for key, group in groups.items():
+            pending[pool.submit(_answer_one, client, group[0], schemas, limiter, history_budget,
+                                dry_run, use_templates)] = key
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key = pending.pop(future)
+                for item in groups.pop(key, [])[1:]:
+                    pending[pool.submit(_answer_one, client, item, schemas, limiter,
+                                        history_budget, dry_run, use_templates)] = None
+                results.append(future.result())
+                if on_result:
+                    on_result(results[-1], len(results), len(items))
+
+    elapsed = time.perf_counter() - start
+    usage = usage_summary([r["usage"] for r in results if r["usage"]])
+    ok = sum(1 for r in results if r["status"] == "ok")
+    return {
+        "results": results,
+        "total": len(items),
+        "ok": ok,
+        "error": len(results) - ok,
+        "unknown_columns": sum(len(r["unknown_columns"]) for r in results),
+        "dry_run_failed": sum(1 for r in results for d in r.get("dry_run", ())
+                              if d["status"] == "error"),
+        "template_hits": sum(1 for r in results if r["source"] == "template"),
+        "elapsed_s": elapsed,
+        "prompts_per_min": len(items) / elapsed * 60 if elapsed else 0.0,
+        **{k: usage[k] for k in ("input_tokens", "cache_creation_input_tokens",
+                                 "cache_read_input_tokens", "output_tokens", "cost_usd",
+                                 "saved_usd", "hit_rate", "avg_latency_ms", "retries")},
+    }
+
+
 # --- Streamlit UI ---
 
 def init_session():
@@ -296,30 +1783,297 @@ def init_session():
         st.session_state.temp_schema = None
     if "current_chat" not in st.session_state:
         st.session_state.current_chat = None
-
-
-def render_message(role: str, content: str):
+    if "usage_log" not in st.session_state:
+        st.session_state.usage_log = []
+    if "sql_validation" not in st.session_state:
+        st.session_state.sql_validation = {"responses": 0, "issues": 0, "repairs": 0, "prevented": 0}
+    if "template_stats" not in st.session_state:
+        st.session_state.template_stats = {"requests": 0, "hits": 0, "hit_ms": 0.0}
+    if "warmup_session" not in st.session_state:
+        st.session_state.warmup_session = uuid.uuid4().hex
+        st.session_state.warmup_prefix = None
+        st.session_state.asked_prefixes = set()
+    if "history_shown" not in st.session_state:
+        st.session_state.history_shown = HISTORY_PAGE_SIZE
+    if "render_stats" not in st.session_state:
+        st.session_state.render_stats = {area: {"runs": 0, "last_ms": 0.0, "total_ms": 0.0}
+                                         for area in ("app", "sidebar", "chat")}
+
+
+@contextmanager
+def track_render(area: str):
+    """Count and time reruns of one UI area (app, sidebar or chat fragment).
+
+    Also flushes buffered spans: a fragment rerun skips the script-level flush.
+    """
+    start = time.perf_counter()
+    try:
+        with tracer.span(f"render_{area}"):
+            yield
+    finally:
+        tracer.flush()
+    stats = st.session_state.render_stats[area]
+    ms = (time.perf_counter() - start) * 1000
+    stats["runs"] += 1
+    stats["last_ms"] = ms
+    stats["total_ms"] += ms
+
+
+def render_message(role: str, content: str, cached: bool = False, template: bool = False):
     """Render a chat message with SQL blocks."""
     with st.chat_message(role):
         st.markdown(content)
+        if cached:
+            st.caption("⚡ Served from cache")
+        if template:
+            st.caption("🧩 Generated from schema templates")
+
+
+def _show_earlier_messages():
+    st.session_state.history_shown += HISTORY_PAGE_SIZE
+
+
+def render_history(messages: list):
+    """Render the latest messages; older ones are only rendered once requested."""
+    hidden = max(0, len(messages) - st.session_state.history_shown)
+    with tracer.span("render_history", messages=len(messages) - hidden, hidden=hidden):
+        if hidden:
+            st.button(f"⬆ Show {min(hidden, HISTORY_PAGE_SIZE)} earlier messages ({hidden} hidden)",
+                      key="btn_history_more", on_click=_show_earlier_messages)
+        for msg in messages[hidden:]:
+            render_message(msg["role"], msg["content"], msg.get("cached", False),
+                           msg.get("template", False))
+
+
+def render_checklist(client, system_blocks: list, messages: list, sections: list,
+                     history_budget: int) -> str:
+    """Run the Quick Checklist fan-out, rendering each section as soon as it completes."""
+    start = time.perf_counter()
+    slots = []
+    for n, section in enumerate(sections, 1):
+        slots.append(st.empty())
+        slots[-1].markdown(f"### {n}. {section[1]}\n\n⏳ Generating...")
+
+    texts = [""] * len(sections)
+    for i, text, stats in run_checklist(client, system_blocks, messages, sections, history_budget):
+        texts[i] = text
+        slots[i].markdown(f"### {i + 1}. {sections[i][1]}\n\n{text}")
+        if "usage" in stats:
+            st.session_state.usage_log.append(stats["usage"])
+
+    for slot in slots:
+        slot.empty()
+    response = merge_checklist(sections, texts)
+    st.markdown(response)
+    st.caption(f"{len(sections)} checks generated in parallel in "
+               f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    return response
+
+
+def get_column_lookup(temp_schema: dict = None) -> dict:
+    """Column lookup for all loaded tables plus the session's temp schema."""
+    lookup = get_schema_registry().column_lookup()
+    if temp_schema:
+        lookup = {**lookup, **build_column_lookup({
+            temp_schema["name"]: [col for _, col, _ in iter_columns(temp_schema["definition"])]})}
+    return lookup
+
+
+def validate_and_repair(client, system_blocks: list, messages: list, response: str,
+                        history_budget: int) -> str:
+    """Check the response's SQL columns offline; on unknown names, ask once for a targeted fix."""
+    lookup = get_column_lookup(st.session_state.temp_schema)
+    report = validate_response(response, lookup)
+    counters = st.session_state.sql_validation
+    counters["responses"] += 1
+    if not report["blocks"]:
+        return response
+    if not report["issues"]:
+        st.caption(f"✅ SQL columns validated ({report['blocks']} blocks, {report['elapsed_ms']:.1f} ms)")
+        return response
+
+    counters["issues"] += len(report["issues"])
+    names = ", ".join(f"`{issue['identifier']}`" for issue in report["issues"])
+    st.warning(f"Unknown columns in generated SQL: {names} - requesting a fix")
+    repair_messages = messages + [
+        {"role": "assistant", "content": response},
+        {"role": "user", "content": repair_prompt(report["issues"])},
+    ]
+    stats = {}
+    try:
+        with st.spinner("Repairing SQL..."):
+            repaired = chat_with_claude(client, system_blocks, repair_messages, history_budget, stats)
+    except Exception as e:
+        # Keep the original answer so it still reaches the chat and the answer cache
+        st.warning(describe_api_error(e))
+        return response
+    st.session_state.usage_log.append(stats["usage"])
+    counters["repairs"] += 1
+
+    recheck = validate_response(repaired, lookup)
+    if not recheck["issues"]:
+        counters["prevented"] += 1
+    st.markdown("**🔧 Repaired answer**")
+    st.markdown(repaired)
+    st.caption(f"SQL re-validated: {len(recheck['issues'])} unknown columns remain")
+    return repaired
+
+
+def reference_options(schemas: dict, select_key: str) -> list:
+    """Tables for a reference picker; with many tables, narrowed by a search box."""
+    table_index = get_schema_registry().table_index()
+    if len(schemas) <= TABLE_SEARCH_LIMIT:
+        return table_index.names
+    query = st.text_input("Find reference table", key=f"{select_key}_search",
+                          placeholder="name or column...")
+    matches = table_index.search(query)[0]
+    chosen = st.session_state.get(select_key)
+    if chosen in schemas and chosen not in matches:
+        matches = [chosen] + matches
+    return matches
+
+
+def warm_selection_prefix(api_key: str, schemas: dict, skill_prompt: str, reference: str):
+    """Schedule a background prompt-cache warm-up when the selection's system prompt changed."""
+    schema_text = format_selected_schema(
+        schemas, st.session_state.selected_tables, st.session_state.temp_schema)
+    project_context = build_project_context(
+        schemas, st.session_state.selected_tables, detect_qa_modes(st.session_state.messages))
+    system_blocks = build_system_prompt(skill_prompt, reference, schema_text, project_context)
+    prefix = prefix_hash(system_blocks)
+    if prefix != st.session_state.warmup_prefix:
+        st.session_state.warmup_prefix = prefix
+        # Skip prefixes the last question already wrote (e.g. after it switched QA mode)
+        if get_prompt_warmer().is_warm(prefix):
+            return
+        get_prompt_warmer().schedule(
+            st.session_state.warmup_session, get_client(api_key), system_blocks)
 
 
-def main():
-    st.set_page_config(
-        page_title="QA Copilot",
-        page_icon="🔍",
-        layout="wide"
-    )
+def render_dry_run(response: str, schemas: dict, temp_schema: dict = None):
+    """Run the response's SQL locally and show per-block status and sample results."""
+    start = time.perf_counter()
+    runs = dry_run_sql(response, schemas, temp_schema)
+    if not runs:
+        return
+    elapsed = (time.perf_counter() - start) * 1000
+    ok = sum(1 for _, r in runs if r["status"] == "ok")
+    failed = sum(1 for _, r in runs if r["status"] == "error")
+    icon = "🧪" if not failed else "⚠️"
+    with st.expander(f"{icon} Local dry-run: {ok}/{len(runs)} blocks ran in {elapsed:.0f} ms",
+                     expanded=bool(failed)):
+        for n, (block, result) in enumerate(runs, 1):
+            if result["status"] == "ok":
+                note = " (cached)" if result["cached"] else ""
+                st.markdown(f"**{n}.** ✅ {result['row_count']} rows{note}")
+                if result["rows"]:
+                    st.dataframe([dict(zip(result["columns"], row)) for row in result["rows"]],
+                                 hide_index=True, use_container_width=True)
+            elif result["status"] == "unsupported":
+                st.markdown(f"**{n}.** ⏭️ Skipped: {result['error']}")
+            else:
+                st.markdown(f"**{n}.** ❌ {result['error']}")
+                st.code(block, language="sql")
+        st.caption(f"SQLite with {SAMPLE_ROWS} synthetic rows per table - checks that run here "
+                   "still need the warehouse for real results")
+
+
+def render_debug_panel():
+    """Per-stage latency from recent trace spans (shown with ?debug=1)."""
+    with st.expander("🐞 Stage latency", expanded=True):
+        st.caption(" | ".join(
+            f"{area}: {s['runs']} runs, last {s['last_ms']:.0f} ms"
+            for area, s in st.session_state.render_stats.items()))
+        if not tracer.enabled:
+            st.caption("Tracing is off - set QA_COPILOT_TRACE=memory, jsonl or sqlite")
+            return
+        stats = tracer.stats()
+        if not stats:
+            st.caption("No spans recorded yet")
+            return
+        st.dataframe(
+            [{"stage": name, "count": s["count"], "p50 ms": round(s["p50_ms"], 1),
+              "p95 ms": round(s["p95_ms"], 1), "max ms": round(s["max_ms"], 1)}
+             for name, s in stats.items()],
+            hide_index=True, use_container_width=True)
+        if tracer.sink:
+            st.caption(f"Spans written to {tracer.sink.path}")
+
+
+def render_usage_summary():
+    """Show session prompt-cache hit rate, token, cost and latency totals."""
+    summary = usage_summary(st.session_state.usage_log)
+    served = sum(1 for m in st.session_state.messages if m.get("cached"))
+    if served:
+        st.caption(f"⚡ {served} answers served from cache (no API call)")
+    templates = st.session_state.template_stats
+    if templates["hits"]:
+        st.caption(
+            f"🧩 Templates answered {templates['hits']}/{templates['requests']} questions "
+            f"({templates['hits'] / templates['requests']:.0%} hit rate, "
+            f"avg {templates['hit_ms'] / templates['hits']:.1f} ms, no API call)")
+    warmer = get_prompt_warmer()
+    if st.session_state.get("warm_prompt_cache"):
+        warm_usage = usage_summary(warmer.usage)
+        first = [f"{label} {sum(ms) / len(ms):.0f} ms (n={len(ms)})"
+                 for label, ms in (("warmed", warmer.first_ttft["warm"]),
+                                   ("cold", warmer.first_ttft["cold"])) if ms]
+        st.caption(
+            f"🔥 Warm-up: {warmer.stats['sent']} sent, {warmer.stats['deduped']} deduplicated, "
+            f"${warm_usage['cost_usd']:.4f}"
+            + (f" | first-question first token: {', '.join(first)}" if first else ""))
+    checks = st.session_state.sql_validation
+    if checks["issues"]:
+        st.caption(
+            f"🔎 SQL validator: {checks['issues']} unknown columns caught, {checks['repairs']} auto-repairs, "
+            f"{checks['prevented']} failed warehouse runs + manual round-trips prevented")
+    if not summary["requests"]:
+        st.caption("No API requests yet")
+        return
+    col1, col2 = st.columns(2)
+    col1.metric("Cache hit rate", f"{summary['hit_rate']:.0%}")
+    col2.metric("Cost (est.)", f"${summary['cost_usd']:.4f}",
+                delta=f"-${summary['saved_usd']:.4f} cached", delta_color="off")
+    st.caption(
+        f"{summary['requests']} requests | input {summary['input_tokens']:,} | "
+        f"cache write {summary['cache_creation_input_tokens']:,} | "
+        f"cache read {summary['cache_read_input_tokens']:,} | output {summary['output_tokens']:,}")
+    ttft = summary["avg_ttft_ms"]
+    st.caption(f"Avg latency {summary['avg_latency_ms']:.0f} ms"
+               + (f" | avg first token {ttft:.0f} ms" if ttft is not None else "")
+               + f" | {summary['retries']} retries")
 
-    init_session()
 
-    # Load data
-    all_schemas = load_all_schemas()
-    skill_prompt = load_skill_prompt()
-    reference = load_reference()
+# Widget callbacks run before the fragment reruns, so sidebar-only changes need no st.rerun()
+
+def _mark_tables_changed():
+    st.session_state.tables_changed = True
+
 
-    # --- Sidebar ---
-    with st.sidebar:
+def _save_current_chat():
+    name = st.session_state.chat_name_input.strip()
+    if not name or not st.session_state.messages:
+        return
+    save_chat(name, st.session_state.messages, st.session_state.selected_tables,
+              st.session_state.temp_schema)
+    st.session_state.current_chat = name
+
+
+def _delete_saved_chat(chat_name: str):
+    delete_chat(chat_name)
+    if st.session_state.current_chat == chat_name:
+        st.session_state.current_chat = None
+
+
+def _set_chat_page(page: int):
+    st.session_state.chat_page = page
+
+
+@st.fragment
+def render_sidebar():
+    """Sidebar: settings, table selection, schema tools and saved chats."""
+    all_schemas = load_all_schemas()
+    with track_render("sidebar"):
         st.title("🔍 QA Copilot")
         st.caption("AI-powered SQL Assistant")
 
@@ -330,48 +2084,99 @@ def main():
             "Claude API Key",
             type="password",
             value=os.getenv("ANTHROPIC_API_KEY", ""),
+            key="api_key",
             help="Enter your Anthropic API key"
         )
 
         if not api_key:
             st.warning("Please enter API Key")
 
+        with st.expander("⚙️ Settings", expanded=False):
+            st.toggle(
+                "Stream responses", value=True, key="stream_responses",
+                help="Render the answer as it is generated")
+            st.number_input(
+                "History token budget", min_value=4000, max_value=180000,
+                value=HISTORY_TOKEN_BUDGET, step=4000, key="history_budget",
+                help="Input tokens for system prompt + chat history; older turns are summarized")
+            st.number_input(
+                "Column pruning (top-K, 0 = off)", min_value=0, max_value=200, value=0, key="prune_top_k",
+                help="Send only key/grain/SCD2 columns plus the K columns most relevant to the question. "
+                     "Saves tokens on wide tables, but the schema block is then question-specific")
+            st.toggle(
+                "Parallel checklist", value=True, key="parallel_checklist",
+                help="Split 'full checklist' / 'health check' requests into per-check requests run concurrently")
+            st.toggle(
+                "Validate SQL columns", value=True, key="validate_sql_columns",
+                help="Check generated SQL against the schemas offline and auto-repair unknown columns once")
+            st.toggle(
+                "Answer cache", value=True, key="use_answer_cache",
+                help="Reuse saved answers for repeated opening questions on the same tables/context")
+            st.toggle(
+                "Template answers", value=True, key="use_templates",
+                help="Answer standard duplicate / NULL percentage / SCD2 version checks from the "
+                     "schema metadata without calling the model")
+            st.toggle(
+                "Warm prompt cache", value=False, key="warm_prompt_cache",
+                help="When the tables or temp schema change, write the new system prompt into the "
+                     "prompt cache in the background so the first question is faster (costs one "
+                     "cache write per selection)")
+            st.toggle(
+                "Dry-run SQL locally", value=False, key="use_dry_run",
+                help=f"Run generated SQL on SQLite tables with {SAMPLE_ROWS} synthetic rows each, "
+                     "built from the schemas, before spending warehouse credits")
+
+        if st.query_params.get("debug"):
+            render_debug_panel()
+
         st.divider()
 
         # Table Selection
         st.subheader("📊 Select Tables for QA")
 
         if all_schemas:
-            table_names = list(all_schemas.keys())
+            table_index = get_schema_registry().table_index()
+            current = [t for t in st.session_state.selected_tables if t in all_schemas]
+            if len(all_schemas) > TABLE_SEARCH_LIMIT:
+                search_col, project_col = st.columns([3, 2])
+                query = search_col.text_input(
+                    "Search tables", key="table_search",
+                    placeholder="name, column, description...")
+                project = project_col.selectbox(
+                    "Project", ["All"] + table_index.projects, key="table_project")
+                matches, total = table_index.search(query, None if project == "All" else project)
+                st.caption(f"{total} of {len(all_schemas)} tables match"
+                           + (f" - showing the first {len(matches)}" if total > len(matches) else ""))
+            else:
+                matches = table_index.names
+            # Keep the current selection in the options so searching never drops it
+            options = current + [t for t in matches if t not in current]
             selected = st.multiselect(
                 "Select tables (multi-select)",
-                options=table_names,
-                default=st.session_state.selected_tables or table_names[:1],
-                help="AI will generate SQL based on selected schemas"
+                options=options,
+                default=current or options[:1],
+                help="AI will generate SQL based on selected schemas",
+                on_change=_mark_tables_changed
             )
             st.session_state.selected_tables = selected
+            if st.session_state.pop("tables_changed", False):
+                st.rerun()  # the chat area shows and uses the selection
 
             # Show selected table info
             if selected:
                 with st.expander(f"{len(selected)} tables selected", expanded=False):
                     for table in selected:
-                        info = all_schemas[table]
-                        defn = info["definition"]
-                        # Count columns (handle both formats)
-                        cols = defn.get("columns", {})
-                        if isinstance(cols, dict):
-                            # New format: grouped columns
-                            col_count = sum(
-                                len(group) for group in cols.values() if isinstance(group, dict))
-                        else:
-                            # Old format: list of columns
-                            col_count = len(cols)
-                        desc = defn.get("description", "")[:60]
+                        summary = table_index.summaries[table]
                         st.markdown(f"**{table}**")
-                        st.caption(f"{col_count} columns | {desc}...")
+                        st.caption(f"{summary['columns']} columns | {summary['description']}...")
         else:
             st.info("No schema files found. Add .yml files to tables/ directory")
 
+        load_stats = get_schema_registry().stats
+        st.caption(
+            f"Schemas: {load_stats['files']} files | load {load_stats['last_load_ms']:.1f} ms | "
+            f"reparsed {load_stats['reparsed']} ({load_stats['last_reparse_ms']:.1f} ms)")
+
         st.divider()
 
         # Schema Generator
@@ -384,7 +2189,8 @@ def main():
 
             ref_table = st.selectbox(
                 "Reference table (optional)",
-                options=["None"] + list(all_schemas.keys()),
+                options=["None"] + reference_options(all_schemas, "ref_table"),
+                key="ref_table",
                 help="Copy patterns and infer join keys from this table"
             )
 
@@ -392,7 +2198,7 @@ def main():
                 if schema_input.strip():
                     with st.spinner("Generating..."):
                         try:
-                            client = Anthropic(api_key=api_key)
+                            client = get_client(api_key)
                             ref_schema = ""
                             if ref_table != "None":
                                 ref_schema = json.dumps(
@@ -402,7 +2208,7 @@ def main():
                             st.session_state.generated_schema = extract_json_from_response(
                                 response)
                         except Exception as e:
-                            st.error(f"Error: {e}")
+                            st.error(describe_api_error(e))
 
             # Preview and save/use
             if st.session_state.generated_schema:
@@ -430,6 +2236,44 @@ def main():
                 except json.JSONDecodeError:
                     st.warning("Invalid JSON - please regenerate")
 
+        # Bulk schema generation
+        with st.expander("📦 Bulk Generate Schemas", expanded=False):
+            bulk_file = st.file_uploader(
+                "CSV of column lists", type=["csv"],
+                help="Columns: table_name + columns (one row per table), "
+                     "or table_name + column_name (one row per column)")
+            bulk_ref = st.selectbox(
+                "Reference table (optional)",
+                options=["None"] + reference_options(all_schemas, "bulk_ref_table"),
+                key="bulk_ref_table")
+            bulk_overwrite = st.checkbox("Overwrite existing files", value=False)
+
+            if st.button("Generate all", key="btn_bulk_generate", use_container_width=True,
+                         disabled=not (api_key and bulk_file)):
+                try:
+                    items = _items_from_csv(bulk_file.getvalue().decode("utf-8"))
+                except (ValueError, UnicodeDecodeError) as e:
+                    st.error(f"Could not read CSV: {e}")
+                    items = []
+                if items:
+                    progress = st.progress(0.0, text=f"0 / {len(items)}")
+                    ref_schema = ""
+                    if bulk_ref != "None":
+                        ref_schema = json.dumps(all_schemas[bulk_ref]["definition"], indent=2)
+                    report = run_schema_batch(
+                        get_client(api_key), items, ref_schema, overwrite=bulk_overwrite,
+                        on_result=lambda r, done, total: progress.progress(
+                            done / total, text=f"{done} / {total} ({r['name']}: {r['status']})"))
+                    st.session_state.usage_log.extend(
+                        r["usage"] for r in report["results"] if r["usage"])
+                    st.success(
+                        f"{report['ok']} saved, {report['invalid']} invalid, {report['exists']} skipped, "
+                        f"{report['error']} failed in {report['elapsed_s']:.1f}s "
+                        f"({report['tables_per_min']:.1f} tables/min)")
+                    for r in report["results"]:
+                        if r["errors"]:
+                            st.caption(f"{r['name']}: {'; '.join(r['errors'])}")
+
         # Show active temp schema
         if st.session_state.temp_schema:
             st.success(f"Temp: {st.session_state.temp_schema['name']}")
@@ -446,28 +2290,33 @@ def main():
         if st.session_state.current_chat:
             st.caption(f"Current: {st.session_state.current_chat}")
 
-        # Save current chat
-        if st.session_state.messages:
-            with st.expander("Save chat", expanded=False):
-                default_name = st.session_state.current_chat or ""
-                chat_name = st.text_input(
-                    "Chat name", value=default_name, key="chat_name_input")
-                if st.button("Save", key="btn_save_chat", use_container_width=True):
-                    if chat_name.strip():
-                        save_chat(
-                            chat_name.strip(),
-                            st.session_state.messages,
-                            st.session_state.selected_tables,
-                            st.session_state.temp_schema
-                        )
-                        st.session_state.current_chat = chat_name.strip()
-                        st.success(f"Saved: {chat_name}")
-                        st.rerun()
+        # Save current chat - always shown: sending a message reruns only the chat
+        # fragment, so the first message arrives without this sidebar rerunning
+        with st.expander("Save chat", expanded=False):
+            default_name = st.session_state.current_chat or ""
+            chat_name = st.text_input(
+                "Chat name", value=default_name, key="chat_name_input")
+            st.button("Save", key="btn_save_chat", use_container_width=True,
+                      on_click=_save_current_chat,
+                      disabled=not chat_name.strip() or not st.session_state.messages)
+
+        # Search saved chats
+        chat_query = st.text_input(
+            "Search chats", key="chat_search", placeholder="Search saved messages...")
+        if chat_query.strip():
+            matches = search_chats(chat_query)
+            saved_chats = [m["name"] for m in matches]
+            if not matches:
+                st.caption("No matching chats")
+        else:
+            total_chats = get_chat_store().count()
+            pages = max(1, -(-total_chats // CHATS_PAGE_SIZE))
+            page = min(st.session_state.get("chat_page", 0), pages - 1)
+            saved_chats = list_chats(CHATS_PAGE_SIZE, page * CHATS_PAGE_SIZE)
 
         # List saved chats
-        saved_chats = list_chats()
         if saved_chats:
-            for chat_name in saved_chats[:10]:  # Show last 10
+            for chat_name in saved_chats:
                 col1, col2 = st.columns([4, 1])
                 with col1:
                     is_current = chat_name == st.session_state.current_chat
@@ -479,88 +2328,240 @@ def main():
                             "tables", [])
                         st.session_state.temp_schema = data.get("temp_schema")
                         st.session_state.current_chat = chat_name
+                        st.session_state.history_shown = HISTORY_PAGE_SIZE
+                        st.session_state.pop("chat_name_input", None)
                         st.rerun()
                 with col2:
-                    if st.button("🗑", key=f"del_{chat_name}"):
-                        delete_chat(chat_name)
-                        if st.session_state.current_chat == chat_name:
-                            st.session_state.current_chat = None
-                        st.rerun()
+                    st.button("🗑", key=f"del_{chat_name}", on_click=_delete_saved_chat,
+                              args=(chat_name,))
+
+        # Page through saved chats
+        if not chat_query.strip() and pages > 1:
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                st.button("‹", key="chat_prev", disabled=page == 0,
+                          on_click=_set_chat_page, args=(page - 1,))
+            with col2:
+                st.caption(f"Page {page + 1} / {pages}")
+            with col3:
+                st.button("›", key="chat_next", disabled=page >= pages - 1,
+                          on_click=_set_chat_page, args=(page + 1,))
 
         # New chat button
         if st.button("+ New Chat", use_container_width=True):
             st.session_state.messages = []
             st.session_state.current_chat = None
+            st.session_state.history_shown = HISTORY_PAGE_SIZE
+            st.session_state.pop("chat_name_input", None)
             st.rerun()
 
-    # --- Main Chat Area ---
-    st.header("💬 Chat")
 
-    has_context = st.session_state.selected_tables or st.session_state.temp_schema
-    if not has_context:
-        st.info("👈 Please select tables or generate a temp schema first")
-        return
-
-    # Display selected context
-    context_parts = list(st.session_state.selected_tables)
-    if st.session_state.temp_schema:
-        context_parts.append(f"[Temp] {st.session_state.temp_schema['name']}")
-    st.caption(f"Current context: {', '.join(context_parts)}")
-
-    # Quick reference for keywords
-    with st.expander("💡 Keywords → Skills", expanded=False):
-        st.markdown("""
-| Keywords | Mode | What it does |
-|----------|------|--------------|
-| `duplicates`, `NULL`, `grain`, `count` | General QA | Basic data quality checks |
-| `new feature`, `validate`, `verify`, `business logic` | Feature Testing | Validate specific business rules |
-| `regression`, `baseline`, `before/after` | Regression | Compare before/after a change |
-| `migration`, `Azure`, `AWS`, `compare` | Migration QA | Cross-environment validation |
-| `standard QA`, `full checklist`, `health check` | **Quick Checklist** | One-click generate all checks |
-        """)
-
-    # Chat history
-    for msg in st.session_state.messages:
-        render_message(msg["role"], msg["content"])
-
-    # Chat input
-    if prompt := st.chat_input("Describe the QA query you need, e.g.: check for duplicate records"):
-        if not api_key:
-            st.error("Please enter API Key in sidebar")
+@st.fragment
+def render_chat():
+    """Chat area: history and input; sending a message reruns only this fragment."""
+    all_schemas = load_all_schemas()
+    skill_prompt = load_skill_prompt()
+    reference = load_reference()
+    # Settings live in the sidebar fragment; read them from session state
+    settings = st.session_state
+    api_key = settings.get("api_key", "")
+    stream_responses = settings.get("stream_responses", True)
+    history_budget = settings.get("history_budget", HISTORY_TOKEN_BUDGET)
+    prune_top_k = settings.get("prune_top_k", 0)
+    parallel_checklist = settings.get("parallel_checklist", True)
+    validate_sql_columns = settings.get("validate_sql_columns", True)
+    use_answer_cache = settings.get("use_answer_cache", True)
+    use_dry_run = settings.get("use_dry_run", False)
+    use_templates = settings.get("use_templates", True)
+    warm_prompt_cache = settings.get("warm_prompt_cache", False)
+
+    with track_render("chat"):
+        # --- Main Chat Area ---
+        st.header("💬 Chat")
+        with st.expander("📈 Usage & cache", expanded=False):
+            usage_slot = st.empty()
+        with usage_slot.container():
+            render_usage_summary()
+
+        has_context = st.session_state.selected_tables or st.session_state.temp_schema
+        if not has_context:
+            st.info("👈 Please select tables or generate a temp schema first")
             return
+        if warm_prompt_cache and api_key and not prune_top_k:
+            warm_selection_prefix(api_key, all_schemas, skill_prompt, reference)
 
-        # Add user message
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        render_message("user", prompt)
-
-        # Generate response
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    client = Anthropic(api_key=api_key)
-                    schema_text = format_selected_schema(
-                        all_schemas, st.session_state.selected_tables,
-                        st.session_state.temp_schema)
-
-                    # Load project context from selected tables
-                    projects = get_projects_from_tables(
-                        all_schemas, st.session_state.selected_tables)
-                    project_context = "\n\n---\n\n".join(
-                        load_project_context(p) for p in projects if load_project_context(p))
+        # Display selected context
+        context_parts = list(st.session_state.selected_tables)
+        if st.session_state.temp_schema:
+            context_parts.append(f"[Temp] {st.session_state.temp_schema['name']}")
+        st.caption(f"Current context: {', '.join(context_parts)}")
+
+        # Quick reference for keywords
+        with st.expander("💡 Keywords → Skills", expanded=False):
+            st.markdown("""
+    | Keywords | Mode | What it does |
+    |----------|------|--------------|
+    | `duplicates`, `NULL`, `grain`, `count` | General QA | Basic data quality checks |
+    | `new feature`, `validate`, `verify`, `business logic` | Feature Testing | Validate specific business rules |
+    | `regression`, `baseline`, `before/after` | Regression | Compare before/after a change |
+    | `migration`, `Azure`, `AWS`, `compare` | Migration QA | Cross-environment validation |
+    | `standard QA`, `full checklist`, `health check` | **Quick Checklist** | One-click generate all checks |
+            """)
+
+        # Chat history; new turns render into the same container, above the input
+        history = st.container()
+        with history:
+            render_history(st.session_state.messages)
+
+        # Chat input - inline rather than pinned to the bottom, since it lives in a fragment
+        if prompt := st.chat_input("Describe the QA query you need, e.g.: check for duplicate records"):
+            with history:
+                if not api_key:
+                    st.error("Please enter API Key in sidebar")
+                    return
+
+                # Add user message
+                st.session_state.messages.append({"role": "user", "content": prompt})
+                render_message("user", prompt)
+
+                # Generate response
+                with st.chat_message("assistant"):
+                    try:
+                        template_start = time.perf_counter()
+                        templated = answer_from_templates(
+                            prompt, all_schemas, st.session_state.selected_tables,
+                            st.session_state.temp_schema, st.session_state.template_stats) \
+                            if use_templates else None
+                        cached = False
+                        if templated:
+                            response = templated
+                            st.markdown(response)
+                            st.caption(
+                                f"🧩 Generated from schema templates in "
+                                f"{(time.perf_counter() - template_start) * 1000:.1f} ms (no API call)")
+                        else:
+                            client = get_client(api_key)
+                            if prune_top_k:
+                                schema_text, prune_stats = format_pruned_schema(
+                                    all_schemas, st.session_state.selected_tables, prompt, prune_top_k,
+                                    st.session_state.temp_schema)
+                                st.caption(
+                                    f"Schema pruned: {prune_stats['full_tokens']:,} → "
+                                    f"{prune_stats['pruned_tokens']:,} tokens "
+                                    f"({prune_stats['omitted']} columns omitted)")
+                            else:
+                                schema_text = format_selected_schema(
+                                    all_schemas, st.session_state.selected_tables,
+                                    st.session_state.temp_schema)
+
+                            # Load project context from selected tables for the session's QA modes
+                            qa_modes = detect_qa_modes(st.session_state.messages)
+                            project_context = build_project_context(
+                                all_schemas, st.session_state.selected_tables, qa_modes)
+                            if len(qa_modes) > 1:
+                                st.caption(f"QA mode: {', '.join(qa_modes[1:])}")
+
+                            system_blocks = build_system_prompt(
+                                skill_prompt, reference, schema_text, project_context)
+                            prefix = prefix_hash(system_blocks)
+                            first_on_prefix = prefix not in st.session_state.asked_prefixes
+                            prefix_warmed = get_prompt_warmer().is_warm(prefix)
+
+                            # The key ignores the conversation, so only opening questions are cached
+                            cacheable = use_answer_cache and len(st.session_state.messages) == 1
+                            answer_cache = get_answer_cache()
+                            fingerprint = context_fingerprint(schema_text, project_context)
+                            lookup_start = time.perf_counter()
+                            response = answer_cache.get(prompt, fingerprint, CHAT_MODEL) \
+                                if cacheable else None
+                            cached = response is not None
+
+                            if cached:
+                                st.markdown(response)
+                                st.caption(
+                                    f"⚡ Served from cache in "
+                                    f"{(time.perf_counter() - lookup_start) * 1000:.1f} ms")
+                            else:
+                                if cacheable:
+                                    similar = answer_cache.similar(prompt, fingerprint, CHAT_MODEL)
+                                    if similar:
+                                        with st.expander(f"🔁 {len(similar)} similar cached answers",
+                                                         expanded=False):
+                                            for score, past_prompt, past_answer in similar:
+                                                st.markdown(f"**{past_prompt}** ({score:.0%} match)")
+                                                st.markdown(past_answer)
+
+                                call_stats = {}
+                                if parallel_checklist and is_checklist_request(prompt):
+                                    sections = checklist_sections(
+                                        all_schemas, st.session_state.selected_tables,
+                                        st.session_state.temp_schema)
+                                    response = render_checklist(
+                                        client, system_blocks, st.session_state.messages, sections,
+                                        history_budget)
+                                elif stream_responses:
+                                    response = st.write_stream(chat_with_claude_stream(
+                                        client, system_blocks, st.session_state.messages, call_stats,
+                                        history_budget))
+                                    st.caption(
+                                        f"First token {call_stats.get('ttft_ms', 0):.0f} ms | "
+                                        f"total {call_stats.get('total_ms', 0):.0f} ms")
+                                else:
+                                    with st.spinner("Thinking..."):
+                                        response = chat_with_claude(
+                                            client, system_blocks, st.session_state.messages, history_budget,
+                                            call_stats)
+                                    st.markdown(response)
+                                get_prompt_warmer().mark_warm(prefix)
+                                if "usage" in call_stats:
+                                    st.session_state.usage_log.append(call_stats["usage"])
+                                first_ms = call_stats.get("ttft_ms", call_stats.get("total_ms"))
+                                if first_on_prefix and first_ms is not None:
+                                    st.session_state.asked_prefixes.add(prefix)
+                                    get_prompt_warmer().record_first_question(prefix_warmed, first_ms)
+                                if validate_sql_columns:
+                                    response = validate_and_repair(
+                                        client, system_blocks, st.session_state.messages, response,
+                                        history_budget)
+                                if cacheable:
+                                    answer_cache.put(prompt, fingerprint, CHAT_MODEL, response)
+
+                        if use_dry_run:
+                            render_dry_run(response, all_schemas, st.session_state.temp_schema)
+
+                        message = {"role": "assistant", "content": response}
+                        if cached:
+                            message["cached"] = True
+                        if templated:
+                            message["template"] = True
+                        st.session_state.messages.append(message)
+
+                    except Exception as e:
+                        st.error(describe_api_error(e))
+
+            with usage_slot.container():
+                render_usage_summary()
 
-                    system_blocks = build_system_prompt(
-                        skill_prompt, reference, schema_text, project_context)
 
-                    response = chat_with_claude(
-                        client, system_blocks, st.session_state.messages)
+def main():
+    st.set_page_config(
+        page_title="QA Copilot",
+        page_icon="🔍",
+        layout="wide"
+    )
 
-                    st.session_state.messages.append(
-                        {"role": "assistant", "content": response})
-                    st.rerun()  # Rerun to render with copy buttons
+    init_session()
 
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
+    with track_render("app"):
+        # Sidebar and chat rerun independently; widgets in one do not rebuild the other
+        with st.sidebar:
+            render_sidebar()
+        render_chat()
 
 
 if __name__ == "__main__":
-    main()
+    try:
+        with tracer.span("rerun"):
+            main()
+    finally:
+        tracer.flush()
@@ -0,0 +1,303 @@
+"""
+Benchmarks for the local hot paths
+Generates a synthetic schema corpus (both YAML formats) and chat store, times schema
+loading, prompt assembly, chat listing and an offline end-to-end chat turn at several
+scales, and compares medians against stored baselines
+
+    python -m qa_copilot bench --scales 100 1000 --chats 10000
+"""
+
+import json
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import yaml
+
+import app
+from chat_store import ChatStore
+from sql_validator import validate_response
+from stub_client import StubAnthropic
+
+BASELINE_PATH = Path("bench_baseline.json")
+DEFAULT_SCALES = (100, 1000)
+DEFAULT_CHATS = 10000
+DEFAULT_REPEAT = 5
+REGRESSION_TOLERANCE = 1.5  # flag results slower than baseline x this
+
+_GROUPS = {
+    "Core_Identifiers_and_SCD2": [
+        ("Member_Key", "VARCHAR"), ("Customer_Key", "VARCHAR"), ("CURRENT_RECORD_IND", "NUMBER"),
+        ("Version_No", "NUMBER"), ("Record_Start_Date_Time", "DATETIME"),
+        ("Record_End_Date_Time", "DATETIME"), ("LCF_Load_Timestamp", "DATETIME")],
+    "Account_and_Demographics": [
+        ("Billing_Account_Number", "VARCHAR"), ("Customer_Segment", "VARCHAR"),
+        ("Service_Status_Name", "VARCHAR"), ("Join_Date", "DATE"), ("Region_Code", "VARCHAR"),
+        ("Account_Risk_Code", "VARCHAR"), ("Compromised_Flag", "VARCHAR")],
+    "Financial_Balances": [
+        ("Earned_Balance", "DECIMAL"), ("Redeemed_Balance", "DECIMAL"), ("Plan_Amount", "NUMERIC"),
+        ("Partner_Earn_Value", "NUMERIC"), ("Latest_Redemption_Date", "DATE"),
+        ("Giveaway_Amount", "NUMERIC")],
+    "Device_and_Network": [
+        ("Handset_Brand_Name", "VARCHAR"), ("Handset_Model_Name", "VARCHAR"),
+        ("Network_Type", "VARCHAR"), ("First_Seen_Date", "DATE"), ("Sighting_Count", "NUMBER")],
+    "Event_Attributes": [
+        ("Event_Id", "VARCHAR"), ("Event_Type", "VARCHAR"), ("Event_Timestamp", "TIMESTAMP_NTZ"),
+        ("Channel_Name", "VARCHAR"), ("Amount", "NUMERIC"), ("Source_System", "VARCHAR")],
+}
+_ENUMS = {"Service_Status_Name": ["Active", "Suspended", "Inactive"],
+          "Compromised_Flag": ["Y", "N"], "Network_Type": ["4G", "5G"],
+          "Event_Type": ["EARN", "REDEEM", "EXPIRE"]}
+_PROMPTS = ["check duplicates on grain", "null percentage for balance columns",
+            "validate scd2 version distribution", "compare row counts by join_date"]
+
+
+# --- Synthetic corpus ---
+
+def _table_definition(rng: random.Random, name: str, project: str) -> dict:
+    """One realistic table: 3-5 column groups, enums, a grain and SCD2 architecture notes."""
+    prefix = project.title()
+    columns = {}
+    for group in rng.sample(sorted(_GROUPS), rng.randint(3, 5)):
+        cols = {}
+        for col, col_type in _GROUPS[group]:
+            spec = {"type": col_type, "desc": f"{col.replace('_', ' ')} for {prefix}."}
+            if col in _ENUMS:
+                spec["enum"] = _ENUMS[col]
+            cols[f"{prefix}_{col}" if col.endswith("_Key") else col] = spec
+        columns[group] = cols
+    grain = next(iter(next(iter(columns.values()))))
+    return {
+        "table_name": name,
+        "project": project,
+        "table_grain": grain,
+        "description": f"Synthetic {project} table {name} for benchmarks.",
+        "data_architecture": {
+            "grain_definition": f"{grain} is unique per current record.",
+            "scd_logic": "SCD2: use CURRENT_RECORD_IND = 1 for the latest version.",
+        },
+        "columns": columns,
+    }
+
+
+def generate_corpus(target: Path, n_tables: int, multi_share: float = 0.5,
+                    tables_per_file: int = 5, seed: int = 0) -> Path:
+    """Write `n_tables` synthetic tables to `target`: about `multi_share` of them in
+    multi-table `tables:` files with relationships and business rules, the rest one per file."""
+    rng = random.Random(seed)
+    target.mkdir(parents=True, exist_ok=True)
+    n_multi = int(n_tables * multi_share)
+    projects = ["wallet", "billing", "network", "loyalty"]
+
+    for i in range(n_tables - n_multi):
+        name = f"MODELLED.DS_BENCH_SINGLE_{i:05d}"
+        definition = _table_definition(rng, name, projects[i % len(projects)])
+        with open(target / f"DS_BENCH_SINGLE_{i:05d}.yml", "w", encoding="utf-8") as f:
+            yaml.safe_dump(definition, f, sort_keys=False)
+
+    for start in range(0, n_multi, tables_per_file):
+        tables, names = [], []
+        for i in range(start, min(start + tables_per_file, n_multi)):
+            name = f"REFINED.DS_BENCH_MULTI_{i:05d}"
+            definition = _table_definition(rng, name, projects[i % len(projects)])
+            definition["name"] = definition.pop("table_name")
+            tables.append(definition)
+            names.append(name)
+        content = {
+            "tables": tables,
+            "relationships": [
+                {"from": f"{a}.Billing_Account_Number", "to": f"{b}.Billing_Account_Number",
+                 "type": "many_to_one"} for a, b in zip(names, names[1:])],
+            "business_rules": [
+                {"name": f"bench_rule_{start}_{n}",
+                 "description": f"{name} must have one current record per grain."}
+                for n, name in enumerate(names)],
+        }
+        with open(target / f"DS_BENCH_MULTI_{start:05d}.yml", "w", encoding="utf-8") as f:
+            yaml.safe_dump(content, f, sort_keys=False)
+    return target
+
+
+def populate_chats(store: ChatStore, n_chats: int, seed: int = 0):
+    """Fill a chat store with `n_chats` saved sessions of 2-12 messages."""
+    rng = random.Random(seed)
+    for i in range(n_chats):
+        messages = []
+        for turn in range(rng.randint(1, 6)):
+            messages.append({"role": "user", "content": f"{rng.choice(_PROMPTS)} (turn {turn})"})
+            messages.append({"role": "assistant",
+                             "content": "```sql\nSELECT COUNT(*) FROM MODELLED.DS_BENCH;\n```"})
+        store.save(f"chat_{i:05d}", messages, [f"MODELLED.DS_BENCH_SINGLE_{i % 50:05d}"],
+                   mtime=1_700_000_000 + i)
+
+
+# --- Measurement ---
+
+def measure(fn, repeat: int = DEFAULT_REPEAT, setup=None) -> dict:
+    """Median/min wall time (ms) over `repeat` runs, and the peak traced memory (KiB) of one run."""
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"median_ms": statistics.median(times), "min_ms": min(times), "peak_kib": peak / 1024}
+
+
+def _chat_turn(client, schemas: dict, selected: list, prompt: str) -> dict:
+    """One chat turn as main() runs it, with the stub client: prompt assembly to validated answer."""
+    messages = [{"role": "user", "content": prompt}]
+    schema_text, _ = app.format_pruned_schema(schemas, selected, prompt, 40)
+    context = app.build_project_context(schemas, selected, app.detect_qa_modes(messages))
+    system_blocks = app.build_system_prompt(
+        app.load_skill_prompt(), app.load_reference(), schema_text, context)
+    stats = {}
+    response = "".join(app.chat_with_claude_stream(client, system_blocks, messages, stats))
+    validate_response(response, app.build_column_lookup({
+        name: [col for _, col, _ in app.iter_columns(schemas[name]["definition"])]
+        for name in selected}))
+    return stats
+
+
+def bench_scale(n_tables: int, workdir: Path, repeat: int) -> dict:
+    """All table-count-dependent benchmarks at one corpus size."""
+    corpus = generate_corpus(workdir / f"tables_{n_tables}", n_tables)
+    results = {}
+
+    registry = app.SchemaRegistry(corpus)
+    results["load_all_schemas.cold"] = measure(
+        lambda: registry.load(), repeat, setup=registry.invalidate)
+    registry.load()
+    results["load_all_schemas.warm"] = measure(lambda: registry.load(), repeat)
+
+    # A new process with an up-to-date snapshot: no YAML parsing
+    snapshot = workdir / f"snapshot_{n_tables}.pickle"
+    app.SchemaRegistry(corpus, snapshot).load()
+    results["load_all_schemas.snapshot"] = measure(
+        lambda: app.SchemaRegistry(corpus, snapshot).load(), repeat)
+
+    schemas = registry.load()
+    names = sorted(schemas)
+    results["table_index.build"] = measure(lambda: app.TableIndex(schemas), repeat)
+    table_index = app.TableIndex(schemas)
+    results["table_index.search"] = measure(
+        lambda: [table_index.search(q) for q in ("cust", "wallet balance", "ballance")], repeat)
+    prompt_cache = app.get_prompt_cache()
+    for k in (5, 20):
+        selected = names[:: max(1, len(names) // k)][:k]
+        results[f"format_selected_schema.{k}.cold"] = measure(
+            lambda: app.format_selected_schema(schemas, selected), repeat, setup=prompt_cache.clear)
+        results[f"format_selected_schema.{k}.warm"] = measure(
+            lambda: app.format_selected_schema(schemas, selected), repeat)
+        results[f"format_pruned_schema.{k}"] = measure(
+            lambda: app.format_pruned_schema(schemas, selected, _PROMPTS[1], 40), repeat)
+
+        def assemble():
+            text = app.format_selected_schema(schemas, selected)
+            context = app.build_project_context(schemas, selected)
+            return app.build_system_prompt(
+                app.load_skill_prompt(), app.load_reference(), text, context)
+        results[f"prompt_assembly.{k}"] = measure(assemble, repeat)
+        blocks = assemble()
+        results[f"prompt_assembly.{k}"]["tokens"] = app.system_tokens(blocks)
+        results[f"prompt_assembly.{k}"]["schema_tokens"] = app.estimate_tokens(blocks[-1]["text"])
+
+    client = StubAnthropic()
+    selected = names[:5]
+    results["chat_turn.e2e"] = measure(
+        lambda: _chat_turn(client, schemas, selected, _PROMPTS[0]), repeat)
+    return results
+
+
+def bench_startup(repeat: int) -> dict:
+    """Wall time of `import app` in a fresh interpreter (module imports only, no schemas)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import app"], check=True, capture_output=True,
+                       cwd=Path(app.__file__).parent)
+        times.append((time.perf_counter() - start) * 1000)
+    return {"startup.import_app": {"median_ms": statistics.median(times), "min_ms": min(times)}}
+
+
+def bench_chats(n_chats: int, workdir: Path, repeat: int) -> dict:
+    """Chat store benchmarks at `n_chats` saved sessions."""
+    store = ChatStore(workdir / f"chats_{n_chats}" / "chats.db")
+    start = time.perf_counter()
+    populate_chats(store, n_chats)
+    results = {"chat_store.populate": {"median_ms": (time.perf_counter() - start) * 1000}}
+    results["list_chats.first_page"] = measure(lambda: store.list(app.CHATS_PAGE_SIZE, 0), repeat)
+    results["list_chats.last_page"] = measure(
+        lambda: store.list(app.CHATS_PAGE_SIZE, n_chats - app.CHATS_PAGE_SIZE), repeat)
+    results["chat_store.count"] = measure(store.count, repeat)
+    results["chat_store.search"] = measure(lambda: store.search("scd2 version"), repeat)
+    results["chat_store.load"] = measure(lambda: store.load(f"chat_{n_chats // 2:05d}"), repeat)
+    return results
+
+
+def run(scales=DEFAULT_SCALES, n_chats: int = DEFAULT_CHATS, repeat: int = DEFAULT_REPEAT) -> dict:
+    """Run every benchmark; returns {"<scale>/<name>": metrics}."""
+    results = bench_startup(repeat)
+    with tempfile.TemporaryDirectory(prefix="qa_bench_") as tmp:
+        workdir = Path(tmp)
+        for n_tables in scales:
+            for name, metrics in bench_scale(n_tables, workdir, repeat).items():
+                results[f"tables={n_tables}/{name}"] = metrics
+        if n_chats:
+            for name, metrics in bench_chats(n_chats, workdir, repeat).items():
+                results[f"chats={n_chats}/{name}"] = metrics
+    return results
+
+
+# --- Baselines ---
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results: dict, path: Path = BASELINE_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results: dict, baseline: dict, tolerance: float = REGRESSION_TOLERANCE) -> list:
+    """Rows of (name, median_ms, baseline median_ms, ratio, regressed)."""
+    rows = []
+    for name, metrics in results.items():
+        base = baseline.get(name, {}).get("median_ms")
+        ratio = metrics["median_ms"] / base if base else None
+        # Sub-millisecond timings are too noisy to flag
+        regressed = ratio is not None and ratio > tolerance and metrics["median_ms"] - base > 1.0
+        rows.append((name, metrics["median_ms"], base, ratio, regressed))
+    return rows
+
+
+def format_report(results: dict, rows: list) -> str:
+    """Plain-text table of timings, memory peaks, token sizes and baseline ratios."""
+    lines = [f"{'benchmark':<48} {'median ms':>10} {'peak KiB':>10} {'tokens':>8} {'vs base':>9}"]
+    for name, median, _, ratio, regressed in rows:
+        metrics = results[name]
+        peak = f"{metrics['peak_kib']:.0f}" if "peak_kib" in metrics else "-"
+        tokens = str(metrics.get("tokens", "-"))
+        vs = f"{ratio:.2f}x" if ratio is not None else "new"
+        lines.append(f"{name:<48} {median:>10.2f} {peak:>10} {tokens:>8} {vs:>9}"
+                     + ("  << SLOWER" if regressed else ""))
+    return "\n".join(lines)
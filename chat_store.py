@@ -0,0 +1,213 @@
+"""
+Chat store for saved QA sessions
+SQLite-backed: an index of name/mtime/tables/message count, incremental message appends in
+atomic transactions, paged listing, full-text search, and one-time import of legacy chats/*.json
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+STORE_PATH = Path("chats/chats.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    name TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    tables TEXT NOT NULL,
+    temp_schema TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS chats_mtime ON chats (mtime DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_name TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    extra TEXT,
+    PRIMARY KEY (chat_name, seq)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _extra(msg: dict) -> str:
+    """JSON for message keys besides role/content (private `_` keys are dropped)."""
+    extra = {k: v for k, v in msg.items() if k not in ("role", "content") and not k.startswith("_")}
+    return json.dumps(extra, ensure_ascii=False) if extra else None
+
+
+class ChatStore:
+    """Saved chats in one SQLite file, safe to share between sessions and threads."""
+
+    def __init__(self, path: Path = STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            try:
+                conn.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts "
+                    "USING fts5(content, chat_name UNINDEXED)")
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                # SQLite built without FTS5: search falls back to LIKE
+                self.has_fts = False
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection; the block runs as one transaction and always closes."""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Index ---
+
+    def count(self) -> int:
+        """Number of saved chats."""
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+
+    def list(self, limit: int = 10, offset: int = 0) -> list:
+        """Chat index rows, newest first: [{name, mtime, tables, message_count}]."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name, mtime, tables, message_count FROM chats "
+                "ORDER BY mtime DESC LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+        return [{"name": name, "mtime": mtime, "tables": json.loads(tables),
+                 "message_count": count} for name, mtime, tables, count in rows]
+
+    # --- Read/write ---
+
+    def save(self, name: str, messages: list, tables: list, temp_schema: dict = None,
+             mtime: float = None):
+        """Save a chat, appending only messages added since the last save."""
+        mtime = mtime if mtime is not None else time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT message_count FROM chats WHERE name = ?", (name,)).fetchone()
+            stored = row[0] if row else 0
+
+            # Append if the stored messages are still a prefix of `messages`, else rewrite
+            start = stored
+            if stored > len(messages):
+                start = 0
+            elif stored:
+                last = conn.execute(
+                    "SELECT role, content FROM messages WHERE chat_name = ? AND seq = ?",
+                    (name, stored - 1)).fetchone()
+                prev = messages[stored - 1]
+                if last != (prev["role"], prev["content"]):
+                    start = 0
+            if start == 0 and stored:
+                self._delete_messages(conn, name)
+
+            new = messages[start:]
+            conn.executemany(
+                "INSERT INTO messages (chat_name, seq, role, content, extra) VALUES (?, ?, ?, ?, ?)",
+                [(name, start + i, m["role"], m["content"], _extra(m)) for i, m in enumerate(new)])
+            if self.has_fts:
+                conn.executemany(
+                    "INSERT INTO messages_fts (content, chat_name) VALUES (?, ?)",
+                    [(m["content"], name) for m in new])
+            conn.execute(
+                "INSERT OR REPLACE INTO chats (name, mtime, tables, temp_schema, message_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (name, mtime, json.dumps(tables, ensure_ascii=False),
+                 json.dumps(temp_schema, ensure_ascii=False) if temp_schema else None,
+                 len(messages)))
+
+    def load(self, name: str) -> dict:
+        """Load a chat as {"messages", "tables", "temp_schema"}."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT tables, temp_schema FROM chats WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                raise KeyError(name)
+            rows = conn.execute(
+                "SELECT role, content, extra FROM messages WHERE chat_name = ? ORDER BY seq",
+                (name,)).fetchall()
+        messages = []
+        for role, content, extra in rows:
+            msg = {"role": role, "content": content}
+            if extra:
+                msg.update(json.loads(extra))
+            messages.append(msg)
+        return {"messages": messages, "tables": json.loads(row[0]),
+                "temp_schema": json.loads(row[1]) if row[1] else None}
+
+    def delete(self, name: str):
+        """Delete a chat and its messages."""
+        with self._lock, self._connect() as conn:
+            self._delete_messages(conn, name)
+            conn.execute("DELETE FROM chats WHERE name = ?", (name,))
+
+    def _delete_messages(self, conn: sqlite3.Connection, name: str):
+        conn.execute("DELETE FROM messages WHERE chat_name = ?", (name,))
+        if self.has_fts:
+            conn.execute("DELETE FROM messages_fts WHERE chat_name = ?", (name,))
+
+    # --- Search ---
+
+    def search(self, query: str, limit: int = 10) -> list:
+        """Chats whose messages match `query`, best first: [{name, snippet}]."""
+        query = query.strip()
+        if not query:
+            return []
+        with self._connect() as conn:
+            if self.has_fts:
+                # Quote each term so user input is never parsed as FTS syntax
+                fts_query = " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+                rows = conn.execute(
+                    "SELECT chat_name, snippet(messages_fts, 0, '**', '**', '…', 12) "
+                    "FROM messages_fts WHERE messages_fts MATCH ? ORDER BY rank",
+                    (fts_query,)).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT chat_name, substr(content, 1, 120) FROM messages "
+                    "WHERE content LIKE ? ORDER BY chat_name",
+                    (f"%{query}%",)).fetchall()
+        results, seen = [], set()
+        for name, snippet in rows:
+            if name not in seen:
+                seen.add(name)
+                results.append({"name": name, "snippet": snippet})
+                if len(results) >= limit:
+                    break
+        return results
+
+    # --- Migration ---
+
+    def migrate_json(self, chats_dir: Path) -> int:
+        """Import legacy chats/*.json once; returns the number of chats imported."""
+        with self._connect() as conn:
+            if conn.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone():
+                return 0
+            existing = {r[0] for r in conn.execute("SELECT name FROM chats")}
+        imported = 0
+        for json_file in sorted(Path(chats_dir).glob("*.json")):
+            if json_file.stem in existing:
+                continue
+            try:
+                with open(json_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            self.save(json_file.stem, data.get("messages", []), data.get("tables", []),
+                      data.get("temp_schema"), mtime=json_file.stat().st_mtime)
+            imported += 1
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_migrated', ?)",
+                         (str(imported),))
+        return imported
@@ -0,0 +1,610 @@
+"""
+Local dry-run engine for generated QA SQL
+Builds SQLite tables from schema definitions, fills them with synthetic rows that respect
+enum/type/pk/uniqueness/SCD2 metadata, translates common Snowflake syntax and runs checks
+in parallel with results cached by SQL hash
+"""
+
+import calendar
+import hashlib
+import json
+import random
+import re
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+SAMPLE_ROWS = 200
+NULL_SHARE = 0.05  # share of NULLs in optional columns, so NULL checks have something to find
+MAX_RESULT_ROWS = 20
+RESULT_CACHE_SIZE = 512
+ENGINE_WORKERS = 4
+
+_BASE_DATE = date(2024, 1, 1)
+_OPEN_END = "9999-12-31 00:00:00"
+_NAME_RE = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*(?:\s*\.\s*[A-Za-z_$][A-Za-z0-9_$]*)*")
+
+# Snowflake features with no SQLite equivalent: reported as unsupported instead of failing
+_UNSUPPORTED = [
+    (re.compile(r"\bQUALIFY\b", re.I), "QUALIFY"),
+    (re.compile(r"\bLATERAL\s+FLATTEN\b|\bFLATTEN\s*\(", re.I), "FLATTEN"),
+    (re.compile(r"\b(?:TABLE)?SAMPLE\s*\(", re.I), "SAMPLE"),
+    (re.compile(r"\bSELECT\s+TOP\s+\d", re.I), "TOP"),
+    (re.compile(r"\b(?:UN)?PIVOT\s*\(", re.I), "PIVOT"),
+    (re.compile(r"\bMERGE\s+INTO\b", re.I), "MERGE"),
+]
+_DATE_PARTS = {"y": "year", "yy": "year", "yyyy": "year", "yr": "year", "years": "year",
+               "mm": "month", "mon": "month", "months": "month", "d": "day", "dd": "day",
+               "days": "day", "dayofmonth": "day", "w": "week", "wk": "week", "weeks": "week",
+               "q": "quarter", "qtr": "quarter", "quarters": "quarter", "h": "hour",
+               "hh": "hour", "hours": "hour", "mi": "minute", "minutes": "minute",
+               "s": "second", "sec": "second", "seconds": "second"}
+
+
+# --- Column roles ---
+
+def _affinity(col_type: str) -> str:
+    """SQLite column type for a Snowflake type."""
+    t = (col_type or "VARCHAR").upper()
+    if t.startswith(("INT", "BIGINT", "SMALLINT", "NUMBER", "BOOLEAN")):
+        return "INTEGER"
+    if t.startswith(("NUMERIC", "DECIMAL", "FLOAT", "DOUBLE", "REAL")):
+        return "REAL"
+    return "TEXT"
+
+
+def _role(name: str) -> str:
+    """SCD2 role of a column by name, or None."""
+    lname = name.lower()
+    if re.fullmatch(r"current_(record_)?(ind|flag|indicator)|is_current", lname):
+        return "current"
+    if re.fullmatch(r"version_?(no|num|number)?|record_version", lname):
+        return "version"
+    if re.search(r"(record_start|effective_(from|start)|valid_from)", lname):
+        return "start"
+    if re.search(r"(record_end|effective_(to|end)|valid_to|expiry_date_time)", lname):
+        return "end"
+    return None
+
+
+def _value(spec: dict, rng: random.Random, i: int, unique: bool):
+    """One synthetic value for a column spec; unique columns get a distinct value per i."""
+    enum = spec.get("enum")
+    col_type = str(spec.get("type") or "VARCHAR").upper()
+    if enum and not unique:
+        return rng.choice(enum)
+    if col_type.startswith(("INT", "BIGINT", "SMALLINT", "NUMBER")):
+        return i + 1 if unique else rng.randint(0, 1000)
+    if col_type.startswith(("NUMERIC", "DECIMAL", "FLOAT", "DOUBLE", "REAL")):
+        return float(i + 1) if unique else round(rng.uniform(0, 1000), 2)
+    if col_type.startswith("BOOLEAN"):
+        return rng.randint(0, 1)
+    if col_type == "DATE":
+        return (_BASE_DATE + timedelta(days=i if unique else rng.randint(0, 730))).isoformat()
+    if col_type.startswith(("TIMESTAMP", "DATETIME")):
+        moment = datetime.combine(_BASE_DATE, datetime.min.time()) + timedelta(
+            minutes=i if unique else rng.randint(0, 730 * 1440))
+        return moment.isoformat(sep=" ")
+    if col_type in ("ARRAY", "VARIANT", "OBJECT"):
+        return json.dumps([f"item_{rng.randint(1, 9)}"])
+    return f"V{i:06d}" if unique else f"v_{rng.randint(0, 99)}"
+
+
+def generate_rows(table: dict, n: int = SAMPLE_ROWS, seed: int = 0) -> list:
+    """Synthetic rows (tuples in column order) for a table spec from table_spec-like input.
+
+    `table` has "columns" [(name, spec)], "unique" (column names unique per row),
+    "member" (column names identifying an SCD2 entity) and "scd2".
+    """
+    rng = random.Random(f"{seed}:{table.get('name', '')}")
+    columns = table["columns"]
+    unique = {c.lower() for c in table.get("unique", ())}
+    member = {c.lower() for c in table.get("member", ())}
+    roles = {name: _role(name) if table.get("scd2") else None for name, _ in columns}
+
+    # SCD2: each member gets 1-3 versions with contiguous validity; the last is current
+    versions = []
+    member_no = 0
+    while len(versions) < n:
+        count = rng.choice((1, 1, 2, 3)) if table.get("scd2") else 1
+        start = datetime.combine(_BASE_DATE, datetime.min.time()) + timedelta(days=rng.randint(0, 365))
+        for v in range(1, count + 1):
+            end = start + timedelta(days=rng.randint(1, 90))
+            versions.append((member_no, v, v == count, start, end))
+            start = end
+        member_no += 1
+    versions = versions[:n]
+
+    rows = []
+    for i, (member_no, version, current, start, end) in enumerate(versions):
+        row = []
+        for name, spec in columns:
+            lname = name.lower()
+            role = roles[name]
+            if role == "current":
+                value = 1 if current else 0
+                if str(spec.get("type", "")).upper().startswith("VARCHAR"):
+                    value = "Y" if current else "N"
+            elif role == "version":
+                value = version
+            elif role == "start":
+                value = start.isoformat(sep=" ")
+            elif role == "end":
+                value = _OPEN_END if current else end.isoformat(sep=" ")
+            elif lname in member:
+                value = _value(spec, rng, member_no, unique=True)
+            elif lname in unique or spec.get("pk"):
+                value = _value(spec, rng, i, unique=True)
+            elif rng.random() < NULL_SHARE:
+                value = None
+            else:
+                value = _value(spec, rng, i, unique=False)
+            row.append(value)
+        rows.append(tuple(row))
+    return rows
+
+
+# --- Snowflake -> SQLite ---
+
+def _split_args(text: str) -> list:
+    """Split a call's argument text on top-level commas."""
+    args, depth, current, quote = [], 0, [], False
+    for ch in text:
+        if ch == "'":
+            quote = not quote
+        elif not quote and ch == "(":
+            depth += 1
+        elif not quote and ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0 and not quote:
+            args.append("".join(current).strip())
+            current = []
+        else:
+            current.append(ch)
+    args.append("".join(current).strip())
+    return args
+
+
+def _find_close(sql: str, open_index: int) -> int:
+    """Index of the parenthesis closing the one at open_index (ignoring string literals)."""
+    depth, quote = 0, False
+    for i in range(open_index, len(sql)):
+        ch = sql[i]
+        if ch == "'":
+            quote = not quote
+        elif not quote and ch == "(":
+            depth += 1
+        elif not quote and ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
+def _rewrite_calls(sql: str, name: str, fn) -> str:
+    """Replace every NAME(args) with fn(list of argument strings), innermost-safe."""
+    pattern = re.compile(rf"\b{name}\s*\(", re.I)
+    pos = 0
+    while True:
+        match = pattern.search(sql, pos)
+        if not match:
+            return sql
+        close = _find_close(sql, match.end() - 1)
+        if close < 0:
+            return sql
+        replacement = fn(_split_args(sql[match.end():close]))
+        sql = sql[:match.start()] + replacement + sql[close + 1:]
+        pos = match.start() + 1
+
+
+_CAST_OP_RE = re.compile(r"::\s*([A-Za-z_]+(?:\s*\(\s*\d+(?:\s*,\s*\d+)?\s*\))?)")
+
+
+def _rewrite_cast_operator(sql: str) -> str:
+    """Rewrite `expr::TYPE` as CAST(expr AS TYPE) for identifiers, literals and calls."""
+    while True:
+        match = _CAST_OP_RE.search(sql)
+        if not match:
+            return sql
+        end = match.start()
+        start = end
+        while start > 0 and sql[start - 1].isspace():
+            start -= 1
+        if start > 0 and sql[start - 1] == ")":
+            depth = 0
+            for start in range(start - 1, -1, -1):
+                depth += {")": 1, "(": -1}.get(sql[start], 0)
+                if depth == 0:
+                    break
+            while start > 0 and (sql[start - 1].isalnum() or sql[start - 1] in "_$"):
+                start -= 1
+        elif start > 0 and sql[start - 1] == "'":
+            start = sql.rfind("'", 0, start - 1)
+        else:
+            while start > 0 and (sql[start - 1].isalnum() or sql[start - 1] in "_$."):
+                start -= 1
+        operand = sql[start:end].strip()
+        if not operand:
+            return sql
+        sql = f"{sql[:start]}CAST({operand} AS {match.group(1)}){sql[match.end():]}"
+
+
+def _cast(args: list) -> str:
+    parts = re.split(r"\s+AS\s+", args[0], flags=re.I)
+    if len(parts) < 2:
+        return f"CAST({args[0]})"
+    expr, target = " AS ".join(parts[:-1]), parts[-1].strip().upper()
+    if target == "DATE":
+        return f"DATE({expr})"
+    if target.startswith(("TIMESTAMP", "DATETIME")):
+        return f"DATETIME({expr})"
+    return f"CAST({expr} AS {_affinity(target)})"
+
+
+def _quote_part(args: list) -> list:
+    part = args[0].strip().strip("'\"").lower()
+    return [f"'{_DATE_PARTS.get(part, part)}'"] + args[1:]
+
+
+def translate_sql(sql: str, table_names: dict) -> str:
+    """Rewrite common Snowflake syntax into SQLite.
+
+    `table_names` maps lowercased known table names (SCHEMA.TABLE) to themselves;
+    DATABASE.SCHEMA.TABLE references to them are shortened to SCHEMA.TABLE.
+    """
+    sql = re.sub(r"--[^\n]*", "", sql)
+
+    def shorten(match):
+        parts = [p.strip() for p in match.group(0).split(".")]
+        if len(parts) == 3 and ".".join(parts[1:]).lower() in table_names \
+                and ".".join(parts[:2]).lower() not in table_names:
+            return ".".join(parts[1:])
+        return match.group(0)
+    sql = _NAME_RE.sub(shorten, sql)
+
+    sql = _rewrite_cast_operator(sql)
+    sql = re.sub(r"\bTRY_CAST\s*\(", "CAST(", sql, flags=re.I)
+    sql = _rewrite_calls(sql, "CAST", lambda a: _cast([", ".join(a)]))
+    for name in ("DATEADD", "DATEDIFF", "DATE_TRUNC", "DATE_PART", "TIMESTAMPADD", "TIMESTAMPDIFF"):
+        sql = _rewrite_calls(sql, name, lambda a, n=name: f"{n}_({', '.join(_quote_part(a))})")
+    sql = _rewrite_calls(sql, "EXTRACT", lambda a: "DATE_PART_('{}', {})".format(
+        _DATE_PARTS.get(a[0].split()[0].lower(), a[0].split()[0].lower()),
+        a[0].split(None, 2)[2] if len(a[0].split(None, 2)) == 3 else "NULL"))
+    sql = re.sub(r"\bAPPROX_COUNT_DISTINCT\s*\(", "COUNT(DISTINCT ", sql, flags=re.I)
+    sql = re.sub(r"\bLISTAGG\s*\(", "GROUP_CONCAT(", sql, flags=re.I)
+    sql = re.sub(r"\bWITHIN\s+GROUP\s*\([^)]*\)", "", sql, flags=re.I)
+    sql = re.sub(r"\bILIKE\b", "LIKE", sql, flags=re.I)
+    sql = re.sub(r"\bMINUS\b", "EXCEPT", sql, flags=re.I)
+    sql = re.sub(r"\b(?:DATE|TIMESTAMP)\s+('[^']*')", r"\1", sql, flags=re.I)
+    sql = re.sub(r"\b(CURRENT_DATE|CURRENT_TIMESTAMP)\s*\(\s*\)", r"\1", sql, flags=re.I)
+    sql = re.sub(r"\b(?:SYSDATE|GETDATE)\s*\(\s*\)", "CURRENT_TIMESTAMP", sql, flags=re.I)
+    sql = re.sub(r"\bIFF\s*\(", "IIF(", sql, flags=re.I)
+    sql = re.sub(r"\b(NVL)\s*\(", "IFNULL(", sql, flags=re.I)
+    return sql
+
+
+# --- Snowflake functions registered in SQLite ---
+
+def _parse_moment(value):
+    if value is None:
+        return None
+    text = str(value)
+    try:
+        return datetime.fromisoformat(text[:26])
+    except ValueError:
+        return None
+
+
+def _dateadd(part, amount, value):
+    moment = _parse_moment(value)
+    if moment is None or amount is None:
+        return None
+    amount = int(amount)
+    if part in ("year", "quarter", "month"):
+        months = amount * {"year": 12, "quarter": 3, "month": 1}[part]
+        month = moment.month - 1 + months
+        year, month = moment.year + month // 12, month % 12 + 1
+        day = min(moment.day, calendar.monthrange(year, month)[1])
+        moment = moment.replace(year=year, month=month, day=day)
+    else:
+        unit = {"week": "weeks", "day": "days", "hour": "hours", "minute": "minutes",
+                "second": "seconds"}.get(part, "days")
+        moment = moment + timedelta(**{unit: amount})
+    text = str(value)
+    return moment.date().isoformat() if len(text) <= 10 else moment.isoformat(sep=" ")
+
+
+def _datediff(part, start, end):
+    a, b = _parse_moment(start), _parse_moment(end)
+    if a is None or b is None:
+        return None
+    if part == "year":
+        return b.year - a.year
+    if part == "quarter":
+        return (b.year - a.year) * 4 + (b.month - 1) // 3 - (a.month - 1) // 3
+    if part == "month":
+        return (b.year - a.year) * 12 + b.month - a.month
+    seconds = (b - a).total_seconds() if part in ("hour", "minute", "second") else None
+    if seconds is not None:
+        return int(seconds // {"hour": 3600, "minute": 60, "second": 1}[part])
+    days = (b.date() - a.date()).days
+    return days // 7 if part == "week" else days
+
+
+def _date_trunc(part, value):
+    moment = _parse_moment(value)
+    if moment is None:
+        return None
+    if part == "year":
+        moment = moment.replace(month=1, day=1)
+    elif part == "quarter":
+        moment = moment.replace(month=(moment.month - 1) // 3 * 3 + 1, day=1)
+    elif part == "month":
+        moment = moment.replace(day=1)
+    elif part == "week":
+        moment = moment - timedelta(days=moment.weekday())
+    text = str(value)
+    if len(text) <= 10 or part in ("year", "quarter", "month", "week", "day"):
+        return moment.date().isoformat()
+    return moment.isoformat(sep=" ")
+
+
+def _date_part(part, value):
+    moment = _parse_moment(value)
+    if moment is None:
+        return None
+    if part == "quarter":
+        return (moment.month - 1) // 3 + 1
+    if part == "week":
+        return moment.isocalendar()[1]
+    if part in ("dayofweek", "dow"):
+        return moment.isoweekday() % 7
+    return getattr(moment, part, None)
+
+
+class _Median:
+    def __init__(self):
+        self.values = []
+
+    def step(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def finalize(self):
+        return statistics.median(self.values) if self.values else None
+
+
+class _Stddev(_Median):
+    def finalize(self):
+        return statistics.stdev(self.values) if len(self.values) > 1 else None
+
+
+class _CountIf:
+    def __init__(self):
+        self.count = 0
+
+    def step(self, value):
+        self.count += bool(value)
+
+    def finalize(self):
+        return self.count
+
+
+def _register_functions(conn: sqlite3.Connection):
+    """Snowflake scalar/aggregate functions that SQLite lacks."""
+    scalars = {
+        ("DATEADD_", 3): _dateadd, ("TIMESTAMPADD_", 3): _dateadd,
+        ("DATEDIFF_", 3): _datediff, ("TIMESTAMPDIFF_", 3): _datediff,
+        ("DATE_TRUNC_", 2): _date_trunc, ("DATE_PART_", 2): _date_part,
+        ("LEN", 1): lambda v: None if v is None else len(str(v)),
+        ("YEAR", 1): lambda v: _date_part("year", v),
+        ("MONTH", 1): lambda v: _date_part("month", v),
+        ("DAY", 1): lambda v: _date_part("day", v),
+        ("LAST_DAY", 1): lambda v: _dateadd("day", -1, _dateadd("month", 1, _date_trunc("month", v))),
+        ("ZEROIFNULL", 1): lambda v: 0 if v is None else v,
+        ("NULLIFZERO", 1): lambda v: None if v == 0 else v,
+        ("NVL2", 3): lambda v, a, b: a if v is not None else b,
+        ("DIV0", 2): lambda a, b: None if a is None or b is None else (0 if b == 0 else a / b),
+        ("SPLIT_PART", 3): lambda s, d, n: (str(s).split(d) + [""] * int(n))[int(n) - 1]
+        if s is not None and n else None,
+        ("CONTAINS", 2): lambda s, t: None if s is None or t is None else int(str(t) in str(s)),
+        ("STARTSWITH", 2): lambda s, t: None if s is None or t is None else int(str(s).startswith(str(t))),
+        ("MD5", 1): lambda v: None if v is None else hashlib.md5(str(v).encode()).hexdigest(),
+        ("SHA2", 1): lambda v: None if v is None else hashlib.sha256(str(v).encode()).hexdigest(),
+        ("ARRAY_SIZE", 1): lambda v: len(json.loads(v)) if v else None,
+        ("REGEXP", 2): lambda p, v: None if v is None else int(re.search(p, str(v)) is not None),
+        ("RLIKE", 2): lambda v, p: None if v is None else int(re.search(p, str(v)) is not None),
+    }
+    for (name, n_args), fn in scalars.items():
+        conn.create_function(name, n_args, fn, deterministic=True)
+    # Variadic; conversion functions ignore Snowflake's optional format argument
+    for name in ("CONCAT", "HASH", "GREATEST", "LEAST", "TO_DATE", "TO_TIMESTAMP", "TO_VARCHAR",
+                 "TO_CHAR", "TO_NUMBER", "TO_DECIMAL"):
+        fn = {"CONCAT": lambda *a: None if None in a else "".join(str(x) for x in a),
+              "TO_DATE": lambda v, *_: _parse_moment(v).date().isoformat() if _parse_moment(v) else None,
+              "TO_TIMESTAMP": lambda v, *_: _parse_moment(v).isoformat(sep=" ") if _parse_moment(v) else None,
+              "TO_VARCHAR": lambda v, *_: None if v is None else str(v),
+              "TO_CHAR": lambda v, *_: None if v is None else str(v),
+              "TO_NUMBER": lambda v, *_: None if v is None else float(v),
+              "TO_DECIMAL": lambda v, *_: None if v is None else float(v),
+              "HASH": lambda *a: int(hashlib.md5(repr(a).encode()).hexdigest()[:15], 16),
+              "GREATEST": lambda *a: None if None in a else max(a),
+              "LEAST": lambda *a: None if None in a else min(a)}[name]
+        conn.create_function(name, -1, fn, deterministic=True)
+    conn.create_aggregate("MEDIAN", 1, _Median)
+    for name in ("STDDEV", "STDDEV_SAMP"):
+        conn.create_aggregate(name, 1, _Stddev)
+    conn.create_aggregate("COUNT_IF", 1, _CountIf)
+
+
+# --- Engine ---
+
+def _statements(sql: str) -> list:
+    """Split a script into complete statements."""
+    statements, current = [], ""
+    for line in sql.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            if current.strip().strip(";").strip():
+                statements.append(current.strip())
+            current = ""
+    if current.strip().strip(";").strip():
+        statements.append(current.strip())
+    return statements
+
+
+class LocalEngine:
+    """SQLite databases (one attached file per schema) holding synthetic rows per table.
+
+    Tables are created lazily the first time a check references them and rebuilt
+    when their definition changes. Each check runs on its own read-only
+    connection, so independent checks run in parallel.
+    """
+
+    def __init__(self, rows: int = SAMPLE_ROWS, seed: int = 0, workers: int = ENGINE_WORKERS,
+                 cache_size: int = RESULT_CACHE_SIZE):
+        self.rows = rows
+        self.seed = seed
+        self.workers = workers
+        self.cache_size = cache_size
+        self._dir = Path(tempfile.mkdtemp(prefix="qa_local_"))
+        self._schemas = set()
+        self._built = {}  # lowercased table name -> definition hash
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"checks": 0, "cache_hits": 0, "tables_built": 0, "build_ms": 0.0}
+
+    def close(self):
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+    def _connect(self, read_only: bool = True) -> sqlite3.Connection:
+        """Connection with every schema attached; checks get a query-only one."""
+        conn = sqlite3.connect(self._dir / "main.db", timeout=10, check_same_thread=False)
+        for schema in sorted(self._schemas):
+            conn.execute("ATTACH DATABASE ? AS ?", (str(self._dir / f"{schema}.db"), schema))
+        _register_functions(conn)
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _build(self, tables: dict, names: list):
+        """Create (or rebuild) the named tables with synthetic rows."""
+        with self._lock:
+            todo = [n for n in names if self._built.get(n.lower()) != tables[n]["hash"]]
+            if not todo:
+                return
+            start = time.perf_counter()
+            for name in todo:
+                if "." in name:
+                    self._schemas.add(name.split(".")[-2].lower())
+            conn = self._connect(read_only=False)
+            try:
+                with conn:
+                    for name in todo:
+                        table = tables[name]
+                        qualified = ".".join(f'"{p}"' for p in name.split(".")[-2:])
+                        columns = ", ".join(f'"{col}" {_affinity(spec.get("type"))}'
+                                            for col, spec in table["columns"])
+                        conn.execute(f"DROP TABLE IF EXISTS {qualified}")
+                        conn.execute(f"CREATE TABLE {qualified} ({columns})")
+                        marks = ", ".join("?" * len(table["columns"]))
+                        conn.executemany(f"INSERT INTO {qualified} VALUES ({marks})",
+                                         generate_rows({**table, "name": name}, self.rows, self.seed))
+                        self._built[name.lower()] = table["hash"]
+            finally:
+                conn.close()
+            # A rebuilt table makes earlier results for it stale
+            self._cache.clear()
+            self.stats["tables_built"] += len(todo)
+            self.stats["build_ms"] += (time.perf_counter() - start) * 1000
+
+    @staticmethod
+    def referenced_tables(sql: str, tables: dict) -> list:
+        """Known tables referenced in the SQL (matched by full or last-segment name)."""
+        by_name = {}
+        for name in tables:
+            by_name[name.lower()] = name
+            by_name.setdefault(name.split(".")[-1].lower(), name)
+        found = []
+        for match in _NAME_RE.finditer(sql):
+            parts = [p.strip().lower() for p in match.group(0).split(".")]
+            for k in range(len(parts)):
+                name = by_name.get(".".join(parts[k:]))
+                if name and name not in found:
+                    found.append(name)
+                    break
+        return found
+
+    def run_check(self, sql: str, tables: dict) -> dict:
+        """Translate and run one SQL block against synthetic data for `tables`.
+
+        `tables` maps table name -> table spec (see app.local_table_specs).
+        Returns {"status": ok|error|unsupported, "columns", "rows", "row_count",
+        "elapsed_ms", "error", "translated", "cached"}.
+        """
+        start = time.perf_counter()
+        result = {"status": "ok", "columns": [], "rows": [], "row_count": 0, "error": None,
+                  "translated": None, "cached": False}
+        for pattern, feature in _UNSUPPORTED:
+            if pattern.search(sql):
+                result.update(status="unsupported", error=f"{feature} has no local equivalent",
+                              elapsed_ms=(time.perf_counter() - start) * 1000)
+                return result
+
+        names = self.referenced_tables(sql, tables)
+        lookup = {n.lower(): n for n in tables}
+        translated = translate_sql(sql, lookup)
+        key = hashlib.sha256("\0".join(
+            [translated, str(self.rows), str(self.seed)]
+            + [f"{n}:{tables[n]['hash']}" for n in names]).encode("utf-8")).hexdigest()
+        with self._lock:
+            self.stats["checks"] += 1
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return {**cached, "cached": True,
+                        "elapsed_ms": (time.perf_counter() - start) * 1000}
+
+        self._build(tables, names)
+        result["translated"] = translated
+        conn = self._connect()
+        try:
+            for statement in _statements(translated):
+                cursor = conn.execute(statement)
+                if cursor.description:
+                    result["columns"] = [d[0] for d in cursor.description]
+                    rows = cursor.fetchall()
+                    result["row_count"] = len(rows)
+                    result["rows"] = rows[:MAX_RESULT_ROWS]
+        except sqlite3.Error as e:
+            result.update(status="error", error=str(e))
+        finally:
+            conn.rollback()
+            conn.close()
+        result["elapsed_ms"] = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def run_checks(self, blocks: list, tables: dict) -> list:
+        """Run independent SQL blocks in parallel; results in block order."""
+        if len(blocks) <= 1:
+            return [self.run_check(block, tables) for block in blocks]
+        # Build every referenced table once up front so workers only read
+        names = []
+        for block in blocks:
+            names += [n for n in self.referenced_tables(block, tables) if n not in names]
+        self._build(tables, names)
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(blocks))) as pool:
+            return list(pool.map(lambda block: self.run_check(block, tables), blocks))
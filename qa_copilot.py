@@ -0,0 +1,252 @@
+"""
+QA Copilot - headless command line
+Runs the app's pipeline without the Streamlit UI, e.g. for CI or overnight runs
+
+    python -m qa_copilot schemas new_tables.csv --ref MODELLED.DS_YT_WALLET_CUSTOMER
+    python -m qa_copilot batch prompts.jsonl --out results.jsonl --sql-dir qa_suite/
+    python -m qa_copilot bench --scales 100 1000 --chats 10000
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import app
+
+# Streamlit warns about the missing script-run context on cached calls outside `streamlit run`
+for _name in list(logging.root.manager.loggerDict):
+    if _name.startswith("streamlit"):
+        logging.getLogger(_name).setLevel(logging.ERROR)
+
+
+def _client(args, responder=None):
+    """Real API client, or the offline stub with --stub."""
+    if args.stub:
+        from stub_client import StubAnthropic
+        return StubAnthropic(responder=responder)
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        sys.exit("ANTHROPIC_API_KEY is not set (or pass --stub for an offline run)")
+    return app.get_client(api_key)
+
+
+def cmd_schemas(args) -> int:
+    """Generate, validate and save schemas for many tables."""
+    from stub_client import schema_responder
+
+    items = app.read_schema_inputs(args.input)
+    if not items:
+        print(f"No inputs found in {args.input}", file=sys.stderr)
+        return 1
+
+    ref_schema = ""
+    if args.ref:
+        schemas = app.load_all_schemas()
+        if args.ref not in schemas:
+            print(f"Unknown reference table: {args.ref}", file=sys.stderr)
+            return 1
+        ref_schema = json.dumps(schemas[args.ref]["definition"], indent=2)
+
+    def on_result(result, done, total):
+        detail = result["path"] or "; ".join(result["errors"])
+        print(f"[{done}/{total}] {result['name']}: {result['status']} {detail or ''}".rstrip())
+
+    report = app.run_schema_batch(
+        _client(args, schema_responder), items, ref_schema, workers=args.workers,
+        per_minute=args.rpm, save=not args.no_save, overwrite=args.overwrite,
+        on_result=on_result)
+
+    print(f"\n{report['total']} tables: {report['ok']} ok, {report['invalid']} invalid, "
+          f"{report['exists']} skipped (exists), {report['error']} failed")
+    print(f"{report['elapsed_s']:.1f}s, {report['tables_per_min']:.1f} tables/min | "
+          f"input {report['input_tokens']:,} (cache read {report['cache_read_input_tokens']:,}), "
+          f"output {report['output_tokens']:,} tokens | ${report['cost_usd']:.4f}")
+    return 0 if report["ok"] + report["exists"] == report["total"] else 2
+
+
+def _read_checkpoint(path: Path) -> set:
+    """Ids already answered successfully in an earlier run's output file."""
+    done = set()
+    if not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # partial line from an interrupted write
+            if record.get("status") == "ok":
+                done.add(record["id"])
+    return done
+
+
+def _write_sql(sql_dir: Path, result: dict) -> Path:
+    """Write a result's SQL blocks to <sql_dir>/<id>.sql, with the prompt as a header comment."""
+    blocks = app.extract_sql_blocks(result["response"])
+    if not blocks:
+        return None
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]+", "_", result["id"])
+    header = "\n".join(f"-- {line}" for line in result["prompt"].splitlines())
+    path = sql_dir / f"{safe_id}.sql"
+    path.write_text(header + "\n\n" + "\n\n".join(blocks) + "\n", encoding="utf-8")
+    return path
+
+
+def cmd_batch(args) -> int:
+    """Answer a JSONL file of QA prompts, resuming from the output file."""
+    try:
+        items = app.read_prompt_file(args.input)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.input}: {e}", file=sys.stderr)
+        return 1
+    if args.tables:
+        for item in items:
+            item["tables"] = item["tables"] or args.tables
+
+    out_path = Path(args.out or Path(args.input).with_suffix(".results.jsonl"))
+    if args.restart and out_path.exists():
+        out_path.unlink()
+    done = _read_checkpoint(out_path)
+    todo = [item for item in items if item["id"] not in done]
+    if done:
+        print(f"Resuming: {len(items) - len(todo)} of {len(items)} prompts already answered")
+    if not todo:
+        return 0
+    sql_dir = Path(args.sql_dir) if args.sql_dir else None
+    if sql_dir:
+        sql_dir.mkdir(parents=True, exist_ok=True)
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "a", encoding="utf-8") as out:
+        def on_result(result, n, total):
+            # One flushed line per prompt: the output file doubles as the checkpoint
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            out.flush()
+            detail = result["error"] or ""
+            if result["status"] == "ok":
+                path = _write_sql(sql_dir, result) if sql_dir else None
+                detail = f"-> {path}" if path else ""
+                if result["source"] == "template":
+                    detail += " (template)"
+                if result["unknown_columns"]:
+                    detail += f" (unknown columns: {', '.join(result['unknown_columns'])})"
+                failed = [d["error"] for d in result.get("dry_run", ()) if d["status"] == "error"]
+                if failed:
+                    detail += f" (dry-run failed: {'; '.join(failed)})"
+            print(f"[{n}/{total}] {result['id']}: {result['status']} {detail}".rstrip())
+
+        report = app.run_qa_batch(
+            _client(args), todo, workers=args.workers, per_minute=args.rpm,
+            on_result=on_result, dry_run=args.dry_run, use_templates=not args.no_templates)
+
+    print(f"\n{report['total']} prompts: {report['ok']} ok, {report['error']} failed, "
+          f"{report['unknown_columns']} unknown column references"
+          + (f", {report['dry_run_failed']} SQL blocks failed the local dry-run" if args.dry_run else ""))
+    if report["template_hits"]:
+        print(f"{report['template_hits']} of {report['total']} prompts answered from schema templates "
+              f"({report['template_hits'] / report['total']:.0%}, no API call)")
+    print(f"{report['elapsed_s']:.1f}s, {report['prompts_per_min']:.1f} prompts/min, "
+          f"avg latency {report['avg_latency_ms']:.0f} ms, {report['retries']} retries")
+    print(f"input {report['input_tokens']:,} | cache write {report['cache_creation_input_tokens']:,} | "
+          f"cache read {report['cache_read_input_tokens']:,} ({report['hit_rate']:.0%} hit rate) | "
+          f"output {report['output_tokens']:,} tokens | ${report['cost_usd']:.4f} "
+          f"(saved ${report['saved_usd']:.4f})")
+    print(f"Results: {out_path}")
+    return 0 if report["ok"] == report["total"] else 2
+
+
+def cmd_bench(args) -> int:
+    """Run the benchmark suite and compare against the stored baseline."""
+    import bench
+
+    baseline_path = Path(args.baseline)
+    results = bench.run(args.scales, args.chats, args.repeat)
+    rows = bench.compare(results, bench.load_baseline(baseline_path), args.tolerance)
+    print(bench.format_report(results, rows))
+    if args.update_baseline:
+        bench.save_baseline(results, baseline_path)
+        print(f"\nBaseline written to {baseline_path}")
+        return 0
+    slower = [row[0] for row in rows if row[4]]
+    if slower:
+        print(f"\n{len(slower)} benchmarks slower than baseline x{args.tolerance}", file=sys.stderr)
+        return 2
+    return 0
+
+
+def cmd_traces(args) -> int:
+    """Summarize spans from a trace sink file as per-stage percentiles."""
+    import tracing
+
+    try:
+        spans = tracing.load_spans(args.path)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.path}: {e}", file=sys.stderr)
+        return 1
+    if args.since:
+        spans = [s for s in spans if s["start"] >= time.time() - args.since * 3600]
+    print(f"{'stage':<32} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10}")
+    for name, s in tracing.summarize(spans).items():
+        print(f"{name:<32} {s['count']:>7} {s['p50_ms']:>10.1f} {s['p95_ms']:>10.1f} {s['max_ms']:>10.1f}")
+    return 0
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(prog="qa_copilot", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--stub", action="store_true", help="use the offline stub client")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("schemas", help="bulk-generate table schemas")
+    p.add_argument("input", help="CSV file, or directory of per-table column-list files")
+    p.add_argument("--ref", help="reference table for patterns and join keys")
+    p.add_argument("--workers", type=int, default=app.BATCH_WORKERS)
+    p.add_argument("--rpm", type=float, default=app.BATCH_REQUESTS_PER_MINUTE,
+                   help="max requests per minute (0 = unlimited)")
+    p.add_argument("--no-save", action="store_true", help="validate only, do not write tables/")
+    p.add_argument("--overwrite", action="store_true", help="replace existing table files")
+    p.set_defaults(func=cmd_schemas)
+
+    p = sub.add_parser("batch", help="answer a JSONL file of QA prompts")
+    p.add_argument("input", help='JSONL, one {"prompt": ..., "tables": [...], "id": ...} per line')
+    p.add_argument("--tables", nargs="+", help="tables for prompts that do not list their own")
+    p.add_argument("--out", help="results JSONL, also the resume checkpoint "
+                                 "(default: <input>.results.jsonl)")
+    p.add_argument("--sql-dir", help="also write each answer's SQL to <dir>/<id>.sql")
+    p.add_argument("--workers", type=int, default=app.BATCH_WORKERS)
+    p.add_argument("--rpm", type=float, default=app.BATCH_REQUESTS_PER_MINUTE,
+                   help="max requests per minute (0 = unlimited)")
+    p.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    p.add_argument("--dry-run", action="store_true",
+                   help="also run each answer's SQL on local synthetic data (SQLite)")
+    p.add_argument("--no-templates", action="store_true",
+                   help="send standard checks to the model instead of the template engine")
+    p.set_defaults(func=cmd_batch)
+
+    p = sub.add_parser("bench", help="benchmark schema loading, prompt assembly and chat listing")
+    p.add_argument("--scales", type=int, nargs="+", default=[100, 1000],
+                   help="synthetic table counts to benchmark")
+    p.add_argument("--chats", type=int, default=10000, help="saved chats to benchmark (0 = skip)")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--baseline", default="bench_baseline.json")
+    p.add_argument("--tolerance", type=float, default=1.5,
+                   help="fail when a median is this many times the baseline")
+    p.add_argument("--update-baseline", action="store_true", help="store this run as the baseline")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser("traces", help="per-stage latency percentiles from a trace sink")
+    p.add_argument("path", nargs="?", default=".cache/traces.jsonl",
+                   help="traces .jsonl or .db file (QA_COPILOT_TRACE=jsonl/sqlite)")
+    p.add_argument("--since", type=float, help="only spans from the last N hours")
+    p.set_defaults(func=cmd_traces)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""
+Deterministic SQL templates for standard QA checks
+Answers "duplicates on grain", "NULL percentage" and "SCD2 version distribution" requests
+straight from the schema metadata (grain, keys, SCD2 columns, table type), with no model call.
+Anything more specific returns None so the caller falls back to the model.
+"""
+
+import re
+import time
+
+MAX_PROMPT_WORDS = 20
+
+INTENTS = {
+    "duplicates": re.compile(r"\b(duplicat\w*|dupes?|dups|grain (check|test|uniqueness)|uniqueness)\b"),
+    "nulls": re.compile(r"\b(null (percentage|rate|count)s?|nulls?|missing values|completeness)\b"),
+    "versions": re.compile(r"\b((scd2? )?version (distribution|counts?|spread)|(scd2? )?versions per|scd2? versions?)\b"),
+}
+# Words a template request may contain besides intents and selected table names.
+# Matching is opt-in: any other word (a filter, date, environment, column or question)
+# means the request is more specific than a template and goes to the model.
+FILLER = set("""
+a an the this these all any every each and or of on in for across by per to
+is are there please can you i need want me give show list find check checks run get
+generate write create sql query queries test tests table tables selected rows row
+records record columns column key keys grain count counts data quality qa
+""".split())
+
+TABLE_TYPES = {
+    "scd2": "SCD2 dimension",
+    "snapshot": "Snapshot",
+    "event": "Event",
+    "monthly_fact": "Monthly Fact",
+    "table": "Table",
+}
+
+
+def _named_in(text, columns: list) -> list:
+    """Column names (schema spelling) mentioned as words in free text, in text order."""
+    by_lower = {name.lower(): name for name, _ in columns}
+    found = []
+    for word in re.findall(r"[a-z0-9_]+", str(text or "").lower()):
+        if word in by_lower and by_lower[word] not in found:
+            found.append(by_lower[word])
+    return found
+
+
+def _column(columns: list, pattern: str) -> str:
+    """First column whose lowercased name fully matches `pattern`, or None."""
+    for name, _ in columns:
+        if re.fullmatch(pattern, name.lower()):
+            return name
+    return None
+
+
+def detect_table_type(table: dict) -> dict:
+    """Table type and the columns its checks filter on.
+
+    Returns {"type", "label", "current", "version", "period"}: `current`/`version` are the
+    SCD2 columns, `period` the snapshot date or fact period column checked at its latest value.
+    """
+    definition, columns = table["definition"], table["columns"]
+    name = table["name"].split(".")[-1].lower()
+    grain_text = f"{definition.get('table_grain', '')} {definition.get('description', '')}".lower()
+    info = {"current": None, "version": None, "period": None}
+    if table.get("scd2"):
+        info.update(current=_column(columns, r"current_(record_)?(ind|flag|indicator)|is_current"),
+                    version=_column(columns, r"version_?(no|num|number)?|record_version"))
+        kind = "scd2"
+    elif "snapshot" in name or "snapshot" in grain_text:
+        info["period"] = _column(columns, r"snapshot_(date|dt)|as_of_date|snapshot_date_key")
+        kind = "snapshot"
+    elif name.startswith("f_") and ("monthly" in name or "month" in grain_text):
+        grain_cols = _named_in(definition.get("table_grain"), columns) + _named_in(
+            (definition.get("data_architecture") or {}).get("natural_key"), columns)
+        info["period"] = next((c for c in grain_cols
+                               if re.search(r"date|month|period", c.lower())), None)
+        kind = "monthly_fact"
+    elif "event" in name or "event" in grain_text:
+        kind = "event"
+    else:
+        kind = "table"
+    return {"type": kind, "label": TABLE_TYPES[kind], **info}
+
+
+def key_columns(table: dict) -> dict:
+    """Key column lists of a table.
+
+    {"pk": surrogate key, "grain": declared table grain (else natural key, else pk),
+    "natural": natural key, "entity": SCD2 business key repeated across versions}.
+    """
+    definition, columns = table["definition"], table["columns"]
+    arch = definition.get("data_architecture") or {}
+    pk = _named_in(arch.get("primary_key"), columns) or [
+        name for name, spec in columns if spec.get("pk")]
+    natural = _named_in(arch.get("natural_key"), columns)
+    grain = _named_in(definition.get("table_grain"), columns) or natural or pk
+    entity = []
+    if table.get("scd2"):
+        # Unique among current records, repeated across versions
+        entity = [c for c in natural or grain
+                  if c not in pk and c.lower() not in ("version_no", "current_record_ind")]
+    return {"pk": pk, "grain": grain, "natural": natural, "entity": entity}
+
+
+def _table_words(table_names: list) -> set:
+    """Lowercased table names, by full name and by each dotted part."""
+    words = set()
+    for name in table_names:
+        words |= {name.lower(), *name.lower().split(".")}
+    return words
+
+
+def classify(prompt: str, table_names: list) -> tuple:
+    """Template intents a prompt asks for, or () if it needs the model.
+
+    Every word must be an intent, a selected table name or filler; digits, quoted
+    literals and any other wording send the prompt to the model.
+    """
+    text = prompt.lower()
+    if len(text.split()) > MAX_PROMPT_WORDS or re.search(r"['\"`]", text):
+        return ()
+    intents = tuple(intent for intent, pattern in INTENTS.items() if pattern.search(text))
+    if not intents:
+        return ()
+    for pattern in INTENTS.values():
+        text = pattern.sub(" ", text)
+    allowed = FILLER | _table_words(table_names)
+    if any(word not in allowed for word in re.findall(r"[a-z0-9_]+", text)):
+        return ()
+    return intents
+
+
+def _ident(name: str) -> str:
+    """Column name as a SQL identifier, double-quoted when it is not a plain name."""
+    return name if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_$]*", name) else f'"{name}"'
+
+
+def _idents(names: list) -> str:
+    return ", ".join(_ident(name) for name in names)
+
+
+def _latest(table_name: str, column: str) -> str:
+    return f"{column} = (SELECT MAX({column}) FROM {table_name})"
+
+
+def _where(conditions: list) -> str:
+    return f"WHERE {' AND '.join(conditions)}\n" if conditions else ""
+
+
+def _duplicate_keys(table_name: str, columns: list, conditions: list) -> str:
+    key = _idents(columns)
+    return (f"SELECT {key}, COUNT(*) AS row_count\nFROM {table_name}\n{_where(conditions)}"
+            f"GROUP BY {key}\nHAVING COUNT(*) > 1\nORDER BY row_count DESC\nLIMIT 100;")
+
+
+def duplicates_sql(table: dict, kind: dict) -> list:
+    """(title, sql) checks for duplicates on the grain, natural key and surrogate key."""
+    name, keys = table["name"], key_columns(table)
+    if not keys["grain"]:
+        return []
+    filters = []
+    if kind["current"]:
+        filters.append(f"{kind['current']} = 1")
+    if kind["period"]:
+        filters.append(_latest(name, kind["period"]))
+    scope = " (current records)" if kind["current"] else ""
+    if keys["grain"] == keys["pk"]:
+        # A surrogate-key grain is unique across all versions and periods
+        checks = [("Duplicates on grain", _duplicate_keys(name, keys["grain"], []))]
+    else:
+        checks = [("Duplicates on grain" + scope, _duplicate_keys(name, keys["grain"], filters))]
+    # Without a current flag an SCD2 natural key repeats per version by design
+    if keys["natural"] and keys["natural"] != keys["grain"] \
+            and (kind["current"] or not table.get("scd2")):
+        checks.append(("Natural key uniqueness" + scope,
+                       _duplicate_keys(name, keys["natural"], filters)))
+    if keys["pk"] and keys["pk"] not in (keys["grain"], keys["natural"]):
+        checks.append(("Primary key uniqueness", _duplicate_keys(name, keys["pk"], [])))
+    if kind["version"] and keys["entity"]:
+        entity = _idents(keys["entity"])
+        checks.append(("Duplicate versions per key",
+                       f"SELECT {entity}, {kind['version']}, COUNT(*) AS row_count\nFROM {name}\n"
+                       f"GROUP BY {entity}, {kind['version']}\nHAVING COUNT(*) > 1\nLIMIT 100;"))
+    return checks
+
+
+def nulls_sql(table: dict, kind: dict) -> list:
+    """(title, sql) NULL percentage per column."""
+    name, columns = table["name"], table["columns"]
+    if not columns:
+        return []
+    filters = [f"{kind['current']} = 1"] if kind["current"] else []
+    if kind["period"]:
+        filters.append(_latest(name, kind["period"]))
+    lines = ",\n".join(
+        f"    ROUND(100.0 * (COUNT(*) - COUNT({_ident(col)})) / NULLIF(COUNT(*), 0), 2) "
+        f"AS {_ident(col + '_null_pct')}"
+        for col, _ in columns)
+    return [("NULL percentage per column",
+             f"SELECT\n    COUNT(*) AS total_rows,\n{lines}\nFROM {name}\n{_where(filters)}".rstrip() + ";")]
+
+
+def versions_sql(table: dict, kind: dict) -> list:
+    """(title, sql) distribution of SCD2 versions per business key."""
+    name, keys = table["name"], key_columns(table)
+    if not table.get("scd2") or not keys["entity"]:
+        return []
+    entity = _idents(keys["entity"])
+    checks = [("Version distribution",
+               f"WITH versions AS (\n    SELECT {entity}, COUNT(*) AS version_count\n"
+               f"    FROM {name}\n    GROUP BY {entity}\n)\n"
+               f"SELECT\n    version_count,\n    COUNT(*) AS key_count,\n"
+               f"    ROUND(100.0 * COUNT(*) / SUM(COUNT(*)) OVER (), 2) AS pct_keys\n"
+               f"FROM versions\nGROUP BY version_count\nORDER BY version_count;")]
+    if kind["current"]:
+        checks.append(("Keys without exactly one current record",
+                       f"SELECT {entity}, SUM(CASE WHEN {kind['current']} = 1 THEN 1 ELSE 0 END) "
+                       f"AS current_records\nFROM {name}\nGROUP BY {entity}\n"
+                       f"HAVING SUM(CASE WHEN {kind['current']} = 1 THEN 1 ELSE 0 END) <> 1\nLIMIT 100;"))
+    return checks
+
+
+_BUILDERS = {"duplicates": duplicates_sql, "nulls": nulls_sql, "versions": versions_sql}
+
+
+def _type_note(kind: dict) -> str:
+    if kind["type"] == "scd2":
+        return (f"SCD2 - grain checks use `{kind['current']} = 1`" if kind["current"]
+                else "SCD2 - no current-record flag found, checks cover all versions")
+    if kind["period"]:
+        return f"{kind['label']} - checks the latest `{kind['period']}`; drop that filter to scan all history"
+    if kind["type"] == "event":
+        return "Event - append-only, duplicates usually come from reprocessed events"
+    return kind["label"]
+
+
+def render_answer(intents: tuple, tables: list) -> str:
+    """Markdown answer with one SQL block per check, or None if a table lacks the metadata."""
+    sections = []
+    for table in tables:
+        kind = detect_table_type(table)
+        checks = []
+        for intent in intents:
+            built = _BUILDERS[intent](table, kind)
+            if not built and not (intent == "versions" and not table.get("scd2")):
+                return None
+            checks += built
+        if not checks:
+            continue
+        parts = [f"### {table['name']}\n*{_type_note(kind)}*"]
+        parts += [f"**{title}**\n\n```sql\n{sql}\n```" for title, sql in checks]
+        sections.append("\n\n".join(parts))
+    if not sections:
+        return None
+    skipped = [t["name"] for t in tables if "versions" in intents and not t.get("scd2")]
+    notes = "**QA notes:** generated from the schema metadata (grain, keys, table type) - no model call."
+    if skipped:
+        notes += f" Version distribution skipped for non-SCD2 tables: {', '.join(skipped)}."
+    return "\n\n".join(sections) + "\n\n" + notes
+
+
+def template_answer(prompt: str, tables: list) -> dict:
+    """Template answer for a prompt: {"response", "intents", "elapsed_ms"}, or None to use the model.
+
+    `tables` is a list of {"name", "definition", "columns": [(name, spec)], "scd2"}.
+    """
+    start = time.perf_counter()
+    if not tables:
+        return None
+    intents = classify(prompt, [table["name"] for table in tables])
+    if not intents:
+        return None
+    response = render_answer(intents, tables)
+    if response is None:
+        return None
+    return {"response": response, "intents": intents,
+            "elapsed_ms": (time.perf_counter() - start) * 1000}
@@ -0,0 +1,282 @@
+"""
+Offline SQL identifier validator
+Checks the columns referenced in generated Snowflake SQL against the loaded schemas,
+resolving table aliases, so hallucinated names are caught before anyone runs the query
+"""
+
+import difflib
+import re
+import time
+
+_SQL_BLOCK_RE = re.compile(r"```sql\s*\n(.*?)```", re.DOTALL | re.IGNORECASE)
+_TOKEN_RE = re.compile(r"""
+    (?P<qident>"[^"]+")
+  | (?P<string>'')
+  | (?P<number>\d+(?:\.\d+)?)
+  | (?P<cast>::)
+  | (?P<param>[:$@][A-Za-z0-9_]+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>[(),.;*=<>!+\-/%|])
+""", re.VERBOSE)
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+
+# Words that are never column references (keywords, date parts, types, window frame terms)
+KEYWORDS = set("""
+select from where and or not in is null as on join inner left right full outer cross natural
+group by order having limit offset qualify distinct all any union intersect except minus with
+case when then else end asc desc nulls first last between like ilike rlike regexp escape exists
+over partition rows range unbounded preceding following current row true false insert into
+values update set delete merge using matched create replace table view temporary temp drop alter
+lateral flatten top sample tablesample pivot unpivot for within interval date time timestamp
+cast try_cast to some fetch next only recursive window
+year years month months week weeks day days hour hours minute minutes second seconds quarter
+dayofweek dayofyear yearofweek weekiso epoch epoch_second epoch_millisecond millisecond
+nanosecond ms us ns yy mm dd hh mi ss
+varchar char string text number numeric decimal int integer bigint smallint float double real
+boolean variant object array timestamp_ntz timestamp_ltz timestamp_tz datetime binary
+current_date current_timestamp current_time sysdate localtimestamp
+""".split())
+
+_SOURCE_END = {"where", "group", "order", "having", "limit", "qualify", "join", "inner", "left",
+               "right", "full", "outer", "cross", "natural", "on", "using", "union", "intersect",
+               "except", "minus", "window", "lateral", "sample", "tablesample", "pivot", "unpivot"}
+
+
+def extract_sql_blocks(text: str) -> list:
+    """SQL code blocks in a markdown response."""
+    return [block.strip() for block in _SQL_BLOCK_RE.findall(text)]
+
+
+def build_column_lookup(tables: dict) -> dict:
+    """{table name lowercased (full and last segment): set of lowercased column names}.
+
+    `tables` maps table name -> column names.
+    """
+    lookup = {}
+    for name, columns in tables.items():
+        cols = {c.lower() for c in columns}
+        full = name.lower()
+        lookup[full] = cols
+        lookup.setdefault(full.split(".")[-1], cols)
+    return lookup
+
+
+def _tokens(sql: str) -> list:
+    """(kind, value) tokens with comments removed and each string literal reduced to ''."""
+    sql = _COMMENT_RE.sub(" ", sql)
+    sql = _STRING_RE.sub(" '' ", sql)
+    tokens = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "qident":
+            kind, value = "ident", value[1:-1]
+        tokens.append((kind, value))
+    return tokens
+
+
+def _split_statements(tokens: list) -> list:
+    statements, current = [], []
+    for tok in tokens:
+        if tok == ("op", ";"):
+            if current:
+                statements.append(current)
+            current = []
+        else:
+            current.append(tok)
+    if current:
+        statements.append(current)
+    return statements
+
+
+def _read_name(tokens: list, i: int) -> tuple:
+    """Dotted identifier starting at i -> (parts, next index)."""
+    parts = [tokens[i][1]]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i] == ("op", ".") and tokens[i + 1][0] == "ident":
+        parts.append(tokens[i + 1][1])
+        i += 2
+    return parts, i
+
+
+def _skip_parens(tokens: list, i: int) -> int:
+    """Index after the parenthesis group opening at i."""
+    depth = 0
+    while i < len(tokens):
+        if tokens[i] == ("op", "("):
+            depth += 1
+        elif tokens[i] == ("op", ")"):
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _analyze_statement(tokens: list, lookup: dict) -> dict:
+    """Sources (alias -> columns or None), CTE names and defined aliases of one statement."""
+    lower = [(k, v.lower()) for k, v in tokens]
+    ctes, sources, aliases = set(), {}, set()
+    n = len(lower)
+
+    # CTE names: WITH name [(cols)] AS ( ... ), name AS ( ... )
+    for i, (kind, value) in enumerate(lower):
+        if kind == "ident" and i + 1 < n and lower[i + 1] == ("ident", "as") \
+                and i + 2 < n and lower[i + 2] == ("op", "(") and i > 0 \
+                and lower[i - 1] in (("ident", "with"), ("op", ","), ("ident", "recursive")):
+            ctes.add(value)
+
+    for i, (kind, value) in enumerate(lower):
+        if kind != "ident" or value not in ("from", "join"):
+            continue
+        j = i + 1
+        while j < n:
+            if lower[j] == ("op", "("):
+                # Derived table: columns unknown
+                j = _skip_parens(lower, j)
+                name_parts, resolved = None, None
+            elif lower[j][0] == "ident" and lower[j][1] not in KEYWORDS | _SOURCE_END:
+                name_parts, j = _read_name(lower, j)
+                full = ".".join(name_parts)
+                if full in ctes or name_parts[-1] in ctes:
+                    resolved = None
+                else:
+                    # Tables missing from the schemas stay None (columns unknown)
+                    resolved = lookup.get(full, lookup.get(name_parts[-1]))
+            else:
+                break
+
+            alias = None
+            if j < n and lower[j] == ("ident", "as"):
+                j += 1
+            if j < n and lower[j][0] == "ident" and lower[j][1] not in KEYWORDS | _SOURCE_END:
+                alias = lower[j][1]
+                j += 1
+            if name_parts:
+                sources[name_parts[-1]] = resolved
+                sources[".".join(name_parts)] = resolved
+            if alias:
+                sources[alias] = resolved
+            elif not name_parts:
+                sources[f"<derived{i}>"] = None
+
+            if value == "from" and j < n and lower[j] == ("op", ","):
+                j += 1
+                continue
+            break
+
+    # Column aliases: "AS name" and implicit "expr name"
+    for i, (kind, value) in enumerate(lower):
+        if kind != "ident" or value in KEYWORDS or i == 0:
+            continue
+        prev = lower[i - 1]
+        if prev == ("ident", "as") or prev == ("op", ")") or prev[0] in ("number", "string") \
+                or (prev[0] == "ident" and prev[1] not in KEYWORDS and (i < 2 or lower[i - 2] != ("op", "."))):
+            aliases.add(value)
+    return {"sources": sources, "ctes": ctes, "aliases": aliases}
+
+
+def _split_scopes(tokens: list) -> tuple:
+    """Lift "( SELECT ... )" subqueries out of a statement.
+
+    Returns (outer tokens with each subquery replaced by "(0)", [subquery token lists]).
+    """
+    outer, inner = [], []
+    i, n = 0, len(tokens)
+    while i < n:
+        if tokens[i] == ("op", "(") and i + 1 < n and tokens[i + 1][0] == "ident" \
+                and tokens[i + 1][1].lower() in ("select", "with"):
+            end = _skip_parens(tokens, i)
+            inner.append(tokens[i + 1:end - 1])
+            outer += [("op", "("), ("number", "0"), ("op", ")")]
+            i = end
+        else:
+            outer.append(tokens[i])
+            i += 1
+    return outer, inner
+
+
+def _validate_scope(tokens: list, lookup: dict, parent_sources: dict, issues: list, seen: set):
+    """Check one SELECT scope, then recurse into its subqueries (which see this scope's sources)."""
+    tokens, subqueries = _split_scopes(tokens)
+    info = _analyze_statement(tokens, lookup)
+    own = info["sources"]
+    sources = {**parent_sources, **own}
+    known_cols = [cols for cols in own.values() if cols is not None]
+    # Unqualified names are only checked when every source of this scope is a known table
+    all_known = bool(own) and all(cols is not None for cols in own.values())
+    union = set().union(*known_cols) if known_cols else set()
+    for cols in parent_sources.values():
+        if cols is not None:
+            union |= cols
+    lower = [(k, v.lower()) for k, v in tokens]
+    n = len(lower)
+
+    i = 0
+    while i < n:
+        kind, value = lower[i]
+        if kind != "ident":
+            i += 1
+            continue
+        parts, j = _read_name(lower, i)
+        original = ".".join(v for _, v in tokens[i:j] if v != ".")
+        prev = lower[i - 1] if i else None
+        followed_by_call = j < n and lower[j] == ("op", "(")
+
+        if len(parts) >= 2 and not followed_by_call:
+            qualifier, column = ".".join(parts[:-1]), parts[-1]
+            cols = sources.get(qualifier, sources.get(parts[-2], "missing"))
+            if isinstance(cols, set) and column not in cols and column != "*" \
+                    and (original.lower(), qualifier) not in seen:
+                seen.add((original.lower(), qualifier))
+                issues.append({"identifier": original, "table": qualifier,
+                               "suggestions": difflib.get_close_matches(column, cols, 3, 0.6)})
+        elif len(parts) == 1 and all_known and not followed_by_call \
+                and value not in KEYWORDS and value not in union \
+                and value not in sources and value not in info["aliases"] \
+                and value not in info["ctes"] and prev != ("cast", "::") \
+                and prev != ("ident", "as") and value not in seen:
+            seen.add(value)
+            issues.append({"identifier": tokens[i][1], "table": None,
+                           "suggestions": difflib.get_close_matches(value, union, 3, 0.6)})
+        i = j
+
+    for sub in subqueries:
+        _validate_scope(sub, lookup, sources, issues, seen)
+
+
+def validate_sql(sql: str, lookup: dict) -> list:
+    """Unknown column references in `sql`: [{"identifier", "table", "suggestions"}]."""
+    issues = []
+    for tokens in _split_statements(_tokens(sql)):
+        _validate_scope(tokens, lookup, {}, issues, set())
+    return issues
+
+
+def validate_response(text: str, lookup: dict) -> dict:
+    """Validate every SQL block in an assistant response.
+
+    Returns {"blocks", "issues", "elapsed_ms"}.
+    """
+    start = time.perf_counter()
+    blocks = extract_sql_blocks(text)
+    issues = []
+    for block in blocks:
+        issues.extend(validate_sql(block, lookup))
+    return {"blocks": len(blocks), "issues": issues,
+            "elapsed_ms": (time.perf_counter() - start) * 1000}
+
+
+def repair_prompt(issues: list) -> str:
+    """Follow-up request listing only the unknown identifiers."""
+    lines = []
+    for issue in issues:
+        where = f" (table `{issue['table']}`)" if issue["table"] else ""
+        hint = f" - did you mean {', '.join(f'`{s}`' for s in issue['suggestions'])}?" \
+            if issue["suggestions"] else ""
+        lines.append(f"- `{issue['identifier']}`{where}{hint}")
+    return ("The SQL in your last answer references columns that do not exist in the provided schemas:\n"
+            + "\n".join(lines)
+            + "\n\nRewrite the complete answer using only columns defined in the selected table schemas. "
+              "Keep everything else unchanged.")
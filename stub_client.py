@@ -0,0 +1,300 @@
+"""
+Stub Anthropic client for offline runs (demos, benchmarks, batch dry-runs)
+Mimics the subset of the SDK that app.py uses: messages.create and messages.stream.
+StubAPIServer serves the same replies over local HTTP for exercising the real SDK client.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+DEFAULT_REPLY = """Here is a check for your request.
+
+```sql
+SELECT COUNT(*) AS row_count
+FROM {table};
+```
+
+**QA notes:** stub response - no model was called."""
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def _system_text(system) -> str:
+    """Flatten system blocks (or a plain string) into text."""
+    if isinstance(system, str):
+        return system
+    return "".join(block.get("text", "") for block in system or [])
+
+
+def _message_text(message: dict) -> str:
+    """Flatten a message's content (string or content blocks) into text."""
+    content = message.get("content", "")
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+def _cached_prefix(system) -> str:
+    """System text up to (and including) the last block with cache_control."""
+    if isinstance(system, str):
+        return ""
+    blocks = list(system or [])
+    last = max((i for i, b in enumerate(blocks) if b.get("cache_control")), default=-1)
+    return "".join(b.get("text", "") for b in blocks[:last + 1])
+
+
+def _usage(client, system, messages: list, reply: str) -> SimpleNamespace:
+    """Build a usage object shaped like the SDK's, simulating the prompt cache."""
+    prefix = _cached_prefix(system)
+    prefix_tokens = estimate_tokens(prefix)
+    input_tokens = estimate_tokens(_system_text(system)) - prefix_tokens + sum(
+        estimate_tokens(_message_text(m)) for m in messages)
+    with client._lock:
+        hit = prefix in client.cached_prefixes
+        client.cached_prefixes.add(prefix)
+    return SimpleNamespace(
+        input_tokens=input_tokens,
+        output_tokens=estimate_tokens(reply),
+        cache_creation_input_tokens=0 if hit or not prefix else prefix_tokens,
+        cache_read_input_tokens=prefix_tokens if hit and prefix else 0,
+    )
+
+
+def _response(model: str, reply: str, usage: SimpleNamespace) -> SimpleNamespace:
+    """Build a Message-like response object."""
+    return SimpleNamespace(
+        id="msg_stub",
+        model=model,
+        role="assistant",
+        stop_reason="end_turn",
+        content=[SimpleNamespace(type="text", text=reply)],
+        usage=usage,
+    )
+
+
+class _StubStream:
+    """Context manager mimicking MessageStream: text_stream + get_final_message()."""
+
+    def __init__(self, client: "StubAnthropic", kwargs: dict):
+        self._client = client
+        self._kwargs = kwargs
+        self._reply = client.reply_for(kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        time.sleep(self._client.first_token_delay)
+        size = self._client.chunk_size
+        for i in range(0, len(self._reply), size):
+            if i:
+                time.sleep(self._client.chunk_delay)
+            yield self._reply[i:i + size]
+
+    def get_final_message(self) -> SimpleNamespace:
+        kwargs = self._kwargs
+        return _response(kwargs.get("model", ""), self._reply,
+                         _usage(self._client, kwargs.get("system"), kwargs.get("messages", []), self._reply))
+
+
+class _StubMessages:
+    """messages.create / messages.stream."""
+
+    def __init__(self, client: "StubAnthropic"):
+        self._client = client
+
+    def create(self, **kwargs) -> SimpleNamespace:
+        client = self._client
+        client.record(kwargs)
+        reply = client.reply_for(kwargs)
+        time.sleep(client.first_token_delay + client.chunk_delay * (len(reply) // client.chunk_size))
+        return _response(kwargs.get("model", ""), reply,
+                         _usage(client, kwargs.get("system"), kwargs.get("messages", []), reply))
+
+    def stream(self, **kwargs) -> _StubStream:
+        self._client.record(kwargs)
+        return _StubStream(self._client, kwargs)
+
+
+class StubAnthropic:
+    """Drop-in replacement for anthropic.Anthropic that never touches the network.
+
+    `responder(kwargs) -> str` customizes replies; otherwise a canned SQL answer is returned.
+    Every request's kwargs are kept in `calls` for inspection; system prefixes
+    ending in a cache_control block are remembered to simulate cache reads.
+    """
+
+    def __init__(self, responder=None, first_token_delay: float = 0.0,
+                 chunk_delay: float = 0.0, chunk_size: int = 24):
+        self.responder = responder
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunk_size = chunk_size
+        self.calls = []
+        self.cached_prefixes = set()
+        self._lock = threading.Lock()
+        self.messages = _StubMessages(self)
+
+    def record(self, kwargs: dict):
+        with self._lock:
+            self.calls.append(kwargs)
+
+    def reply_for(self, kwargs: dict) -> str:
+        if self.responder:
+            return self.responder(kwargs)
+        return DEFAULT_REPLY.format(table="YOUR_TABLE")
+
+
+# --- Local HTTP server ---
+
+_ERROR_TYPES = {429: "rate_limit_error", 500: "api_error", 503: "api_error", 529: "overloaded_error"}
+
+
+class StubAPIServer:
+    """Local Messages API endpoint for testing the real SDK client offline.
+
+    `failures` is a list of (status, headers) answered, in order, before any
+    success - e.g. [(429, {"retry-after": "0"}), (529, {})]. Streaming requests
+    get server-sent events.
+
+        with StubAPIServer(failures=[(429, {"retry-after": "0"})]) as server:
+            client = Anthropic(api_key="test", base_url=server.url)
+    """
+
+    def __init__(self, reply: str = None, failures: list = None, latency: float = 0.0):
+        self.reply = reply or DEFAULT_REPLY.format(table="YOUR_TABLE")
+        self.failures = list(failures or [])
+        self.latency = latency
+        self.requests = []
+        self.cached_prefixes = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+    def _next_failure(self):
+        with self._lock:
+            return self.failures.pop(0) if self.failures else None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status: int, payload: dict, headers: dict = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_event(self, event: str, payload: dict):
+                self.wfile.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get("content-length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                with server._lock:
+                    server.requests.append(request)
+                time.sleep(server.latency)
+
+                failure = server._next_failure()
+                if failure:
+                    status, headers = failure
+                    self._send_json(status, {"type": "error", "error": {
+                        "type": _ERROR_TYPES.get(status, "api_error"),
+                        "message": f"stub failure {status}"}}, headers)
+                    return
+
+                usage = _usage(server, request.get("system"),
+                               request.get("messages", []), server.reply)
+                usage = vars(usage)
+                message = {
+                    "id": "msg_stub", "type": "message", "role": "assistant",
+                    "model": request.get("model", ""), "stop_reason": "end_turn",
+                    "stop_sequence": None, "usage": usage,
+                    "content": [{"type": "text", "text": server.reply}],
+                }
+                if not request.get("stream"):
+                    self._send_json(200, message)
+                    return
+
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("cache-control", "no-cache")
+                self.end_headers()
+                self._send_event("message_start", {"type": "message_start", "message": {
+                    **message, "content": [], "stop_reason": None,
+                    "usage": {**usage, "output_tokens": 0}}})
+                self._send_event("content_block_start", {
+                    "type": "content_block_start", "index": 0,
+                    "content_block": {"type": "text", "text": ""}})
+                for i in range(0, len(server.reply), 24):
+                    self._send_event("content_block_delta", {
+                        "type": "content_block_delta", "index": 0,
+                        "delta": {"type": "text_delta", "text": server.reply[i:i + 24]}})
+                self._send_event("content_block_stop", {"type": "content_block_stop", "index": 0})
+                self._send_event("message_delta", {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                    "usage": {"output_tokens": usage["output_tokens"]}})
+                self._send_event("message_stop", {"type": "message_stop"})
+
+        return Handler
+
+
+# --- Canned responders ---
+
+def schema_responder(kwargs: dict) -> str:
+    """Reply to generate_schema() requests with a valid schema built from the listed columns."""
+    text = _message_text(kwargs["messages"][-1])
+    body = text.split("\n\n", 1)[-1]
+    name = "NEW_TABLE"
+    for line in body.splitlines():
+        if line.lower().startswith("table name:"):
+            name = line.split(":", 1)[1].strip() or name
+    columns = {}
+    for line in body.splitlines():
+        if line.lower().startswith("table name:"):
+            continue
+        for token in line.replace(",", "\n").splitlines():
+            col = token.split("(")[0].strip()
+            if col.replace("_", "").isalnum():
+                columns[col] = {"type": "VARCHAR", "desc": f"{col} (stub)"}
+    schema = {
+        "table_name": f"STAGING.{name}",
+        "project": "stub",
+        "table_grain": next(iter(columns), ""),
+        "description": "Generated by the stub client",
+        "columns": {"All_Columns": columns},
+    }
+    return "```json\n" + json.dumps(schema, indent=2) + "\n```"
@@ -0,0 +1,108 @@
+"""
+Offline tests for the API client layer: retries, streaming stats and batch validation
+Run with `python -m pytest -q`; uses stub_client, so no network or API key is needed.
+"""
+
+import json
+
+import pytest
+
+import app
+from stub_client import StubAnthropic, StubAPIServer, schema_responder
+
+SYSTEM = [{"type": "text", "text": "You are a QA assistant. " * 40,
+           "cache_control": {"type": "ephemeral"}}]
+MESSAGES = [{"role": "user", "content": "Check duplicates"}]
+
+
+@pytest.fixture
+def real_client(monkeypatch):
+    """Build SDK clients through get_client rather than the stub it returns in stub mode."""
+    monkeypatch.delenv("QA_COPILOT_STUB", raising=False)
+    return lambda url: app.get_client("test-key", url)
+
+
+@pytest.mark.parametrize("status,headers,wait_s", [
+    (429, {"retry-after": "0.2"}, 0.2),
+    (529, {"retry-after-ms": "150"}, 0.15),
+])
+def test_call_with_retry_honours_retry_after(real_client, status, headers, wait_s):
+    with StubAPIServer(failures=[(status, headers)]) as server:
+        client = real_client(server.url)
+        stats = {}
+        response = app.call_with_retry(
+            lambda: client.messages.create(model=app.CHAT_MODEL, max_tokens=64, system=SYSTEM,
+                                           messages=MESSAGES), stats)
+    assert response.content[0].text == server.reply
+    assert len(server.requests) == 2
+    assert stats["retries"] == 1
+    assert stats["retry_wait_s"] == pytest.approx(wait_s)
+
+
+def test_call_with_retry_gives_up_after_max_retries(real_client):
+    failures = [(529, {"retry-after": "0"})] * 3
+    with StubAPIServer(failures=failures) as server:
+        client = real_client(server.url)
+        stats = {}
+        with pytest.raises(Exception) as excinfo:
+            app.call_with_retry(
+                lambda: client.messages.create(model=app.CHAT_MODEL, max_tokens=64, system=SYSTEM,
+                                               messages=MESSAGES), stats, max_retries=2)
+    assert excinfo.value.status_code == 529
+    assert stats["retries"] == 2
+
+
+def test_stream_reports_ttft_and_usage():
+    client = StubAnthropic(first_token_delay=0.05)
+    stats = {}
+    text = "".join(app.chat_with_claude_stream(client, SYSTEM, MESSAGES, stats))
+    assert text == client.reply_for({})
+    assert stats["ttft_ms"] >= 50
+    assert stats["total_ms"] >= stats["ttft_ms"]
+    usage = stats["usage"]
+    assert usage["ttft_ms"] == stats["ttft_ms"]
+    assert usage["cache_creation_input_tokens"] > 0
+    assert usage["cache_read_input_tokens"] == 0
+    assert usage["output_tokens"] > 0
+
+    # Same system prefix again: read from the prompt cache instead of writing it
+    again = {}
+    "".join(app.chat_with_claude_stream(client, SYSTEM, MESSAGES, again))
+    assert again["usage"]["cache_read_input_tokens"] == usage["cache_creation_input_tokens"]
+    assert again["usage"]["cache_creation_input_tokens"] == 0
+
+
+def test_stream_over_http_reports_ttft_and_usage(real_client):
+    with StubAPIServer() as server:
+        stats = {}
+        text = "".join(app.chat_with_claude_stream(real_client(server.url), SYSTEM, MESSAGES, stats))
+    assert text == server.reply
+    assert stats["ttft_ms"] is not None and stats["ttft_ms"] <= stats["total_ms"]
+    assert stats["usage"]["output_tokens"] > 0
+
+
+def test_run_schema_batch_validates_each_schema():
+    def responder(kwargs):
+        prompt = kwargs["messages"][-1]["content"]
+        if "BROKEN_TABLE" in prompt:
+            return "```json\n" + json.dumps({"table_name": "STAGING.BROKEN_TABLE"}) + "\n```"
+        if "EMPTY_TABLE" in prompt:
+            return "I could not build a schema for this table."
+        return schema_responder(kwargs)
+
+    items = [
+        {"name": "GOOD_TABLE", "input": "wallet_id, balance_amt"},
+        {"name": "BROKEN_TABLE", "input": "wallet_id"},
+        {"name": "EMPTY_TABLE", "input": "wallet_id"},
+    ]
+    seen = []
+    report = app.run_schema_batch(StubAnthropic(responder=responder), items, save=False,
+                                  per_minute=6000, on_result=lambda r, done, total: seen.append(done))
+    results = {r["name"]: r for r in report["results"]}
+
+    assert (report["total"], report["ok"], report["invalid"], report["error"]) == (3, 1, 2, 0)
+    assert results["GOOD_TABLE"]["status"] == "ok"
+    assert results["GOOD_TABLE"]["table_name"] == "STAGING.GOOD_TABLE"
+    assert results["BROKEN_TABLE"]["errors"] == ["missing columns"]
+    assert results["EMPTY_TABLE"]["status"] == "invalid"
+    assert sorted(seen) == [1, 2, 3]
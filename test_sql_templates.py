@@ -0,0 +1,58 @@
+"""
+Tests for template matching: only plain standard-check requests skip the model
+"""
+
+import pytest
+
+import app
+from sql_templates import template_answer
+
+TABLE = "MODELLED.DS_YT_WALLET_CUSTOMER"
+
+
+@pytest.fixture(scope="module")
+def tables():
+    return app.template_tables(app.load_all_schemas(), [TABLE])
+
+
+@pytest.mark.parametrize("prompt,intents", [
+    ("find duplicates", ("duplicates",)),
+    ("dups", ("duplicates",)),
+    ("check duplicates on grain", ("duplicates",)),
+    ("are there any duplicates?", ("duplicates",)),
+    ("find duplicates in ds_yt_wallet_customer", ("duplicates",)),
+    ("duplicates in MODELLED.DS_YT_WALLET_CUSTOMER", ("duplicates",)),
+    ("null percentage per column", ("nulls",)),
+    ("missing values", ("nulls",)),
+    ("check for duplicates and nulls in the selected tables", ("duplicates", "nulls")),
+    ("scd2 version distribution", ("versions",)),
+    ("versions per key", ("versions",)),
+])
+def test_standard_requests_use_templates(tables, prompt, intents):
+    result = template_answer(prompt, tables)
+    assert result is not None
+    assert result["intents"] == intents
+    assert "```sql" in result["response"]
+
+
+@pytest.mark.parametrize("prompt", [
+    "find duplicates in the last 7 days",
+    "duplicates since 2024-01-01",
+    "check duplicates for wallet 12345",
+    "duplicates in azure and aws",
+    "find duplicate customers with status closed",
+    "nulls for active wallets",
+    "null check in prod vs dev",
+    "duplicates from yesterday",
+    "how do nulls work in snowflake?",
+    "what are nulls",
+    "duplicates where wallet_id = 'x'",
+    "duplicates on wallet_id",
+    "compare counts between tables",
+])
+def test_specific_requests_go_to_the_model(tables, prompt):
+    assert template_answer(prompt, tables) is None
+
+
+def test_other_table_names_are_not_filler(tables):
+    assert template_answer("duplicates in ds_yt_wallet_scores", tables) is None
@@ -0,0 +1,258 @@
+"""
+Lightweight timing spans for QA Copilot
+Spans nest per thread, carry attributes (token usage, cache hits) and are buffered to a
+JSONL or SQLite sink. With tracing off every span is a shared no-op object.
+
+    QA_COPILOT_TRACE=jsonl streamlit run app.py      # or sqlite / memory
+"""
+
+import atexit
+import functools
+import itertools
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+TRACE_ENV = "QA_COPILOT_TRACE"  # off (default) | memory | jsonl | sqlite
+TRACE_PATH_ENV = "QA_COPILOT_TRACE_PATH"
+DEFAULT_PATHS = {"jsonl": Path(".cache/traces.jsonl"), "sqlite": Path(".cache/traces.db")}
+RECENT_SPANS = 5000  # kept in memory for the debug panel
+FLUSH_EVERY = 50
+
+
+class _NoopSpan:
+    """Returned by a disabled tracer: enter/exit/set do nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+# Span ids: a per-process random prefix plus a counter (cheaper than a uuid per span)
+_ID_PREFIX = uuid.uuid4().hex[:6]
+_ids = itertools.count(1)
+
+
+class Span:
+    """One timed stage; use as a context manager and add attributes with set()."""
+
+    __slots__ = ("tracer", "name", "attrs", "start", "_t0", "span_id", "parent_id", "trace_id")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        parent = stack[-1] if stack else None
+        self.span_id = f"{_ID_PREFIX}{next(_ids):x}"
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        stack.append(self)
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self._t0) * 1000
+        stack = self.tracer._stack()
+        if self in stack:
+            stack.remove(self)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._record({
+            "name": self.name, "start": self.start, "ms": ms, "trace_id": self.trace_id,
+            "span_id": self.span_id, "parent_id": self.parent_id, **self.attrs})
+        return False
+
+
+# --- Sinks ---
+
+class JsonlSink:
+    """Append spans to a JSONL file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, records: list):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+
+class SqliteSink:
+    """Store spans in a SQLite table (name, start, ms, ids, attributes as JSON)."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS spans (
+                    name TEXT NOT NULL,
+                    start REAL NOT NULL,
+                    ms REAL NOT NULL,
+                    trace_id TEXT,
+                    span_id TEXT,
+                    parent_id TEXT,
+                    attrs TEXT
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS spans_name ON spans (name, start)")
+
+    @contextmanager
+    def _connect(self):
+        """Open a connection that commits on success and always closes."""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def write(self, records: list):
+        keys = ("name", "start", "ms", "trace_id", "span_id", "parent_id")
+        rows = [(*(r[k] for k in keys),
+                 json.dumps({k: v for k, v in r.items() if k not in keys}, default=str))
+                for r in records]
+        with self._connect() as conn:
+            conn.executemany("INSERT INTO spans VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+
+# --- Tracer ---
+
+class Tracer:
+    """Process-wide span recorder. mode: off | memory | jsonl | sqlite."""
+
+    def __init__(self, mode: str = "off", path: Path = None):
+        self.mode = mode if mode in ("memory", "jsonl", "sqlite") else "off"
+        self.enabled = self.mode != "off"
+        self.recent = deque(maxlen=RECENT_SPANS)
+        self._pending = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.sink = None
+        if self.mode in DEFAULT_PATHS:
+            path = Path(path or DEFAULT_PATHS[self.mode])
+            self.sink = JsonlSink(path) if self.mode == "jsonl" else SqliteSink(path)
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name: str, **attrs):
+        """Context manager timing one stage (a shared no-op when tracing is off)."""
+        if not self.enabled:
+            return _NOOP
+        return Span(self, name, attrs)
+
+    def traced(self, name: str = None):
+        """Decorator form of span(), named after the function by default."""
+        def decorator(fn):
+            span_name = name or fn.__name__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with Span(self, span_name, {}):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def annotate(self, **attrs):
+        """Add attributes to the innermost open span of this thread."""
+        if not self.enabled:
+            return
+        stack = self._stack()
+        if stack:
+            stack[-1].attrs.update(attrs)
+
+    def _record(self, record: dict):
+        with self._lock:
+            self.recent.append(record)
+            if self.sink:
+                self._pending.append(record)
+                if len(self._pending) < FLUSH_EVERY:
+                    return
+                batch, self._pending = self._pending, []
+            else:
+                return
+        self.sink.write(batch)
+
+    def flush(self):
+        """Write buffered spans to the sink."""
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if batch and self.sink:
+            self.sink.write(batch)
+
+    def stats(self, records=None) -> dict:
+        """Per-stage {"count", "p50_ms", "p95_ms", "max_ms", "total_ms"} over recent spans."""
+        if records is None:
+            with self._lock:
+                records = list(self.recent)
+        return summarize(records)
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q / 100 * len(ordered))) - 1]
+
+
+def summarize(records) -> dict:
+    """Per-stage latency percentiles for span records."""
+    by_name = {}
+    for record in records:
+        by_name.setdefault(record["name"], []).append(record["ms"])
+    return {name: {"count": len(ms), "p50_ms": percentile(ms, 50), "p95_ms": percentile(ms, 95),
+                   "max_ms": max(ms), "total_ms": sum(ms)}
+            for name, ms in sorted(by_name.items())}
+
+
+def load_spans(path: Path) -> list:
+    """Read span records back from a JSONL or SQLite sink file."""
+    path = Path(path)
+    if path.suffix == ".jsonl":
+        with open(path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT name, start, ms, trace_id, span_id, parent_id, attrs FROM spans").fetchall()
+    finally:
+        conn.close()
+    return [{"name": name, "start": start, "ms": ms, "trace_id": trace_id, "span_id": span_id,
+             "parent_id": parent_id, **json.loads(attrs or "{}")}
+            for name, start, ms, trace_id, span_id, parent_id, attrs in rows]
+
+
+_tracer = Tracer(os.getenv(TRACE_ENV, "off").strip().lower(), os.getenv(TRACE_PATH_ENV) or None)
+atexit.register(_tracer.flush)
+
+
+def get_tracer() -> Tracer:
+    """The process-wide tracer configured from QA_COPILOT_TRACE."""
+    return _tracer